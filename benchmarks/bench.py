@@ -0,0 +1,248 @@
+'''
+Benchmark memestra on a synthetic corpus.
+
+The corpus is made of `--depth` levels of `--width` modules, each module
+importing all the modules of the next level, and of `--clients` files
+importing the first level, which are the scanned files. Every module defines
+`--deprecated` deprecated functions and `--functions` other functions, half of
+which call a function of the next level, down to the deprecated functions of
+the leaf modules, so that recursive scans have deprecated uses to propagate.
+Optionally, some modules forward the symbols of the next level through star
+imports, and leaf modules import the first level back to create import
+cycles.
+
+Each scenario scans all the client files through `memestra()`, recursively or
+not, starting from an empty cache (cold) or from the cache filled by a
+previous run (warm), and is repeated `--repeat` times. Results are written as
+JSON, and can be compared to the results of another run:
+
+    python benchmarks/bench.py --output new.json --compare old.json
+'''
+
+import argparse
+import json
+import os
+import platform
+import shutil
+import statistics
+import sys
+import tempfile
+import time
+
+import memestra
+from memestra import utils
+try:
+    from memestra.memestra import ResolverSession
+except ImportError:  # revisions predating sessions
+    ResolverSession = None
+from memestra.version import __version__
+
+DECORATOR = ('deco', 'deprecated')
+
+
+def module_name(level, index):
+    return 'm_{}_{}'.format(level, index)
+
+
+def generate_module(level, index, args):
+    lines = ['import deco']
+    last_level = level == args.depth - 1
+    if last_level:
+        if args.cycles:
+            lines.append('import {}'.format(module_name(0, index)))
+        targets = []
+    else:
+        targets = [module_name(level + 1, j) for j in range(args.width)]
+        for j, target in enumerate(targets):
+            if args.star and j == 0:
+                lines.append('from {} import *'.format(target))
+            lines.append('import {}'.format(target))
+
+    # cache entries are keyed by content, keep modules distinct
+    lines.append('')
+    lines.append('NAME = {!r}'.format(module_name(level, index)))
+
+    for k in range(args.deprecated):
+        lines.append('')
+        lines.append('@deco.deprecated(reason="use g_{}")'.format(k))
+        lines.append('def f_{}():'.format(k))
+        lines.append('    pass')
+
+    for k in range(args.functions):
+        lines.append('')
+        lines.append('def g_{}(x):'.format(k))
+        lines.append('    y = [x * i for i in range({})]'.format(k + 1))
+        if k % 2 or not args.deprecated:
+            lines.append('    return y')
+        elif targets:
+            target = targets[k % len(targets)]
+            lines.append('    return {}.g_{}(x), y'.format(target, k))
+        else:
+            lines.append('    return f_{}(), y'.format(k % args.deprecated))
+    return '\n'.join(lines) + '\n'
+
+
+def generate_client(index, args):
+    lines = ['import {}'.format(module_name(0, j)) for j in range(args.width)]
+    for k in range(args.functions):
+        target = module_name(0, (index + k) % args.width)
+        lines.append('{}.g_{}({})'.format(target, k, k))
+        if args.deprecated:
+            lines.append('{}.f_{}()'.format(target, k % args.deprecated))
+    return '\n'.join(lines) + '\n'
+
+
+def generate_corpus(directory, args):
+    '''
+    Write the synthetic corpus to `directory', and return the paths of the
+    files to scan.
+    '''
+    sources = {'deco.py': 'def deprecated(*args, **kwargs):\n'
+                          '    return lambda f: f\n'}
+    for level in range(args.depth):
+        for index in range(args.width):
+            sources[module_name(level, index) + '.py'] = \
+                generate_module(level, index, args)
+    clients = []
+    for index in range(args.clients):
+        name = 'client_{}.py'.format(index)
+        sources[name] = generate_client(index, args)
+        clients.append(os.path.join(directory, name))
+
+    for name, source in sources.items():
+        with open(os.path.join(directory, name), 'w') as fd:
+            fd.write(source)
+    return clients
+
+
+def scan(clients, search_paths, recursive, cache_dir):
+    '''
+    Scan `clients' as a fresh memestra process would, and return the elapsed
+    time and the number of deprecated uses found.
+    '''
+    if hasattr(utils, 'resolution_cache'):
+        utils.resolution_cache.clear()
+    start = time.perf_counter()
+    findings = 0
+    if ResolverSession is None:
+        for client in clients:
+            with open(client) as fd:
+                findings += len(memestra.memestra(fd, DECORATOR, 'reason',
+                                                  search_paths, recursive,
+                                                  cache_dir=cache_dir))
+    else:
+        session = ResolverSession(recursive, cache_dir)
+        for client in clients:
+            with open(client) as fd:
+                findings += len(memestra.memestra(fd, DECORATOR, 'reason',
+                                                  search_paths, recursive,
+                                                  session=session))
+        session.flush()
+    return time.perf_counter() - start, findings
+
+
+def run_scenarios(clients, search_paths, workdir, args):
+    results = []
+    for recursive in (False, True):
+        mode = 'recursive' if recursive else 'non-recursive'
+        for cache in ('cold', 'warm'):
+            times = []
+            for repeat in range(args.repeat):
+                cache_dir = os.path.join(workdir, 'cache-{}-{}-{}'.format(
+                    mode, cache, repeat))
+                if cache == 'warm':
+                    scan(clients, search_paths, recursive, cache_dir)
+                elapsed, findings = scan(clients, search_paths, recursive,
+                                         cache_dir)
+                times.append(elapsed)
+                shutil.rmtree(cache_dir)
+            results.append({'name': '{}-{}'.format(mode, cache),
+                            'recursive': recursive,
+                            'cache': cache,
+                            'findings': findings,
+                            'times': times,
+                            'min': min(times),
+                            'median': statistics.median(times)})
+            if args.verbose:
+                print('{:<20} {:>10.4f}s'.format(results[-1]['name'],
+                                                 results[-1]['min']),
+                      file=sys.stderr)
+    return results
+
+
+def compare(results, reference):
+    '''
+    Print, for each scenario, the best time of `reference' and `results',
+    and their ratio.
+    '''
+    reference = {result['name']: result for result in reference['results']}
+    print('{:<20} {:>10} {:>10} {:>8}'.format('scenario', 'reference',
+                                              'current', 'ratio'))
+    for result in results['results']:
+        old = reference.get(result['name'])
+        if old is None:
+            continue
+        print('{:<20} {:>9.4f}s {:>9.4f}s {:>7.2f}x'.format(
+            result['name'], old['min'], result['min'],
+            result['min'] / old['min']))
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description='Benchmark memestra on a synthetic corpus.')
+    parser.add_argument('--depth', type=int, default=4,
+                        help='Number of levels of the import tree')
+    parser.add_argument('--width', type=int, default=4,
+                        help='Number of modules per level')
+    parser.add_argument('--functions', type=int, default=50,
+                        help='Number of functions per module')
+    parser.add_argument('--deprecated', type=int, default=5,
+                        help='Number of deprecated functions per module')
+    parser.add_argument('--clients', type=int, default=10,
+                        help='Number of scanned files')
+    parser.add_argument('--cycles', action='store_true',
+                        help='Make leaf modules import the first level')
+    parser.add_argument('--star', action='store_true',
+                        help='Forward symbols through star imports')
+    parser.add_argument('--repeat', type=int, default=3,
+                        help='Number of runs per scenario')
+    parser.add_argument('--output', default=None,
+                        help='File to write the JSON results to, instead '
+                             'of the standard output')
+    parser.add_argument('--compare', default=None,
+                        help='JSON results of a previous run to compare to')
+    parser.add_argument('-v', '--verbose', action='store_true',
+                        help='Report the scenarios as they complete')
+    args = parser.parse_args(argv)
+
+    workdir = tempfile.mkdtemp(prefix='memestra-bench-')
+    try:
+        corpus_dir = os.path.join(workdir, 'corpus')
+        os.makedirs(corpus_dir)
+        clients = generate_corpus(corpus_dir, args)
+        results = {'memestra': __version__,
+                   'python': platform.python_version(),
+                   'platform': platform.platform(),
+                   'parameters': {key: value for key, value in
+                                  vars(args).items()
+                                  if key not in ('output', 'compare',
+                                                 'verbose')},
+                   'results': run_scenarios(clients, [corpus_dir], workdir,
+                                            args)}
+    finally:
+        shutil.rmtree(workdir)
+
+    if args.output is None:
+        json.dump(results, sys.stdout, indent=2)
+        print()
+    else:
+        with open(args.output, 'w') as fd:
+            json.dump(results, fd, indent=2)
+
+    if args.compare is not None:
+        with open(args.compare) as fd:
+            compare(results, json.load(fd))
+
+
+if __name__ == '__main__':
+    main()
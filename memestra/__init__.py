@@ -1 +1 @@
-from memestra.memestra import memestra
+from memestra.memestra import iter_memestra, memestra
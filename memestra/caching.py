@@ -1,14 +1,26 @@
 import os
 import hashlib
+import json
 import sys
+import tempfile
+import time
 import yaml
 
+from collections import OrderedDict
+
 # not using gast because we only rely on Import and ImportFrom, which are
 # portable. Not using gast prevents an extra costly conversion step.
 import ast
 
 from memestra.docparse import docparse
-from memestra.utils import resolve_module
+from memestra.stats import stats
+from memestra.utils import dump_json, is_racy, load_json, resolve_module
+from memestra.utils import _dir_stamp
+from memestra.utils import SourceStore
+
+# Use the C implementation of the YAML parser when available.
+SafeLoader = getattr(yaml, 'CSafeLoader', yaml.SafeLoader)
+SafeDumper = getattr(yaml, 'CSafeDumper', yaml.SafeDumper)
 
 
 class DependenciesResolver(ast.NodeVisitor):
@@ -19,11 +31,17 @@ class DependenciesResolver(ast.NodeVisitor):
 
     def __init__(self):
         self.result = set()
+        # name under which each module has been imported
+        self.names = {}
+        # names of the imported modules, in order
+        self.modules = []
 
     def add_module(self, module_name):
+        self.modules.append(module_name)
         module_path = resolve_module(module_name)
         if module_path is not None:
             self.result.add(module_path)
+            self.names.setdefault(module_path, module_name)
 
     def visit_Import(self, node):
         for alias in node.names:
@@ -127,10 +145,189 @@ class Format(object):
             raise ValueError("deprecated must be a list of string")
 
 
+class StatIndex(object):
+    '''
+    Persistent mapping from file fingerprints to the hash of their content,
+    so that files that did not change since last run are not hashed again.
+    A fingerprint is made of the file path, size, modification time and
+    inode.
+    '''
+
+    version = 1
+
+    def __init__(self, path):
+        self.path = path
+        self.files = load_json(path, StatIndex.version) or {}
+        self.updates = {}
+        self.hits = 0
+        self.misses = 0
+
+    def lookup(self, module_path):
+        '''
+        Return the current fingerprint of `module_path', and the hash
+        associated to it, or None if it's not known.
+        '''
+        stat = os.stat(module_path)
+        fingerprint = [stat.st_size, stat.st_mtime_ns, stat.st_ino]
+        entry = self.files.get(module_path)
+        if entry is not None and entry[:-1] == fingerprint:
+            self.hits += 1
+            stats.count('stat index hits')
+            return fingerprint, entry[-1]
+        self.misses += 1
+        stats.count('stat index misses')
+        return fingerprint, None
+
+    def store(self, module_path, fingerprint, module_hash):
+        # the file may still change without its fingerprint changing
+        if is_racy(fingerprint[1]):
+            return
+        entry = fingerprint + [module_hash]
+        self.files[module_path] = self.updates[module_path] = entry
+
+    def save(self):
+        if not self.updates:
+            return
+        # Other processes may have updated the index in the meantime
+        files = load_json(self.path, StatIndex.version) or {}
+        files.update(self.updates)
+        dump_json(self.path, StatIndex.version, files)
+        self.updates.clear()
+
+
+class ImportIndex(object):
+    '''
+    Persistent mapping from the hash of a module content to the names of the
+    modules it imports, so that computing a recursive key doesn't require to
+    parse the module again. Names are resolved on each use, so that the
+    index remains valid when modules are installed or removed.
+    '''
+
+    version = 1
+
+    def __init__(self, path):
+        self.path = path
+        self.modules = load_json(path, ImportIndex.version) or {}
+        self.updates = {}
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, module_hash):
+        '''
+        Return the names of the modules imported by the module whose content
+        hashes to `module_hash', or None if it's not known.
+        '''
+        modules = self.modules.get(module_hash)
+        if modules is None:
+            self.misses += 1
+            stats.count('import index misses')
+        else:
+            self.hits += 1
+            stats.count('import index hits')
+        return modules
+
+    def store(self, module_hash, modules):
+        modules = list(OrderedDict.fromkeys(modules))
+        self.modules[module_hash] = self.updates[module_hash] = modules
+
+    def save(self):
+        if not self.updates:
+            return
+        # Other processes may have updated the index in the meantime
+        modules = load_json(self.path, ImportIndex.version) or {}
+        modules.update(self.updates)
+        dump_json(self.path, ImportIndex.version, modules)
+        self.updates.clear()
+
+
+class DependencyGraph(object):
+    '''
+    Persistent import graph, mapping the path of each scanned file or module
+    to the paths of the modules it depends on. Reverse edges are derived from
+    it on demand, to find the files affected by a change.
+    '''
+
+    version = 1
+
+    def __init__(self, path):
+        self.path = path
+        data = load_json(path, DependencyGraph.version) or {}
+        self.dependencies = {path: set(deps) for path, deps in data.items()}
+        self.updates = {}
+        self._dependents = None
+
+    def update(self, graph):
+        '''
+        Replace the dependencies of the files in `graph', a mapping similar
+        to `dependencies'.
+        '''
+        for path, deps in graph.items():
+            deps = set(deps)
+            if self.dependencies.get(path) != deps:
+                self.dependencies[path] = self.updates[path] = deps
+                self._dependents = None
+
+    @property
+    def dependents(self):
+        if self._dependents is None:
+            self._dependents = {}
+            for path, deps in self.dependencies.items():
+                for dep in deps:
+                    self._dependents.setdefault(dep, set()).add(path)
+        return self._dependents
+
+    def affected(self, paths):
+        '''
+        Return the paths of the files at `paths' and of the files depending
+        on them, directly or not.
+        '''
+        dependents = self.dependents
+        affected = set()
+        worklist = list(paths)
+        while worklist:
+            path = worklist.pop()
+            if path not in affected:
+                affected.add(path)
+                worklist.extend(dependents.get(path, ()))
+        return affected
+
+    def save(self):
+        if not self.updates:
+            return
+        # Other processes may have updated the graph in the meantime
+        data = load_json(self.path, DependencyGraph.version) or {}
+        data.update((path, sorted(deps))
+                    for path, deps in self.updates.items())
+        dump_json(self.path, DependencyGraph.version, data)
+        self.updates.clear()
+
+
 class CacheKeyFactoryBase(object):
-    def __init__(self, keycls):
+    def __init__(self, keycls, stat_index=None, sources=None):
         self.keycls = keycls
         self.created = dict()
+        self.stat_index = stat_index
+        self.sources = SourceStore() if sources is None else sources
+
+    def content_hash(self, module_path):
+        '''
+        Hash the content of `module_path', unless the stat index knows it
+        already.
+        '''
+        fingerprint = None
+        if self.stat_index is not None:
+            fingerprint, module_hash = self.stat_index.lookup(module_path)
+            if module_hash is not None:
+                return module_hash
+
+        module_content = self.sources[module_path].content
+        stats.count('bytes hashed', len(module_content))
+        with stats.timer('hash'):
+            module_hash = hashlib.sha256(module_content).hexdigest()
+
+        if fingerprint is not None:
+            self.stat_index.store(module_path, fingerprint, module_hash)
+        return module_hash
 
     def __call__(self, module_path, name_hint=None ):
         if module_path in self.created:
@@ -156,19 +353,16 @@ class CacheKeyFactory(CacheKeyFactoryBase):
 
     class CacheKey(object):
 
-        def __init__(self, module_path, _):
-
-            with open(module_path, 'rb') as fd:
-                module_content = fd.read()
-                module_hash = hashlib.sha256(module_content).hexdigest()
-                self.module_hash = module_hash
+        def __init__(self, module_path, factory):
+            self.module_hash = factory.content_hash(module_path)
 
         @property
         def path(self):
             return self.name.replace('.', os.path.sep)
 
-    def __init__(self):
-        super(CacheKeyFactory, self).__init__(CacheKeyFactory.CacheKey)
+    def __init__(self, stat_index=None, sources=None):
+        super(CacheKeyFactory, self).__init__(CacheKeyFactory.CacheKey,
+                                              stat_index, sources)
 
 
 class RecursiveCacheKeyFactory(CacheKeyFactoryBase):
@@ -177,83 +371,464 @@ class RecursiveCacheKeyFactory(CacheKeyFactoryBase):
     This take into account the module content, and the content of *all* imported
     module. That way, a change in the module hierarchy implies a change in the
     key.
+
+    The modules of an import cycle depend on each other, so they are keyed as
+    a unit: the key of each of them takes into account the content of all of
+    them, and the keys of the modules the cycle imports.
+
+    If `import_index' is set, the modules imported by a module are looked up
+    in it rather than found by parsing the module.
+
+    If `summarize' is set, keys are computed in early-cutoff mode: they take
+    into account the module content and the deprecation summaries of the
+    imported modules instead of their content, as returned by
+    `summarize(module_path, module_key)'. A change in an imported module then
+    only changes the key if it changes its summary. Modules are only
+    summarized once the keys of all the modules they import are known.
     '''
 
     class CacheKey(object):
 
-        def __init__(self, module_path, factory):
-            assert module_path not in factory.created or factory.created[module_path] is None
+        def __init__(self, hashes, dependencies):
+            self.module_hash = hashlib.sha256("".join(hashes).encode("ascii")).hexdigest()
+            self.dependencies = dependencies
 
-            with open(module_path, 'rb') as fd:
-                module_content = fd.read()
+        @property
+        def path(self):
+            return self.name.replace('.', os.path.sep)
 
-                code = ast.parse(module_content)
-                dependencies_resolver = DependenciesResolver()
-                dependencies_resolver.visit(code)
+    def __init__(self, stat_index=None, sources=None, import_index=None,
+                 summarize=None):
+        super(RecursiveCacheKeyFactory, self).__init__(RecursiveCacheKeyFactory.CacheKey,
+                                                       stat_index, sources)
+        self.import_index = import_index
+        self.summarize = summarize
+
+    def imports(self, module_path):
+        '''
+        Return the content hash of `module_path', and a DependenciesResolver
+        holding the modules it imports.
+        '''
+        module_hash = self.content_hash(module_path)
+
+        dependencies_resolver = DependenciesResolver()
+        modules = None
+        if self.import_index is not None:
+            modules = self.import_index.get(module_hash)
+        if modules is None:
+            dependencies_resolver.visit(self.sources[module_path].tree)
+            if self.import_index is not None:
+                self.import_index.store(module_hash,
+                                        dependencies_resolver.modules)
+        else:
+            for module_name in modules:
+                dependencies_resolver.add_module(module_name)
+        return module_hash, dependencies_resolver
 
-                new_deps = []
-                for dep in dependencies_resolver.result:
-                    if factory.get(dep, 1) is not None:
-                        new_deps.append(dep)
+    def __call__(self, module_path, name_hint=None):
+        if module_path in self.created:
+            return self.created[module_path]
+        if name_hint is None:
+            name_hint = os.path.splitext(os.path.basename(module_path))[0]
+        self._visit(module_path, name_hint, {}, [])
+        return self.created[module_path]
+
+    def _visit(self, module_path, name, modules, stack):
+        # Tarjan's algorithm: keys are created one strongly connected
+        # component at a time, once the components it imports are keyed
+        self.created[module_path] = None  # creation in process
+        module_hash, dependencies_resolver = self.imports(module_path)
+
+        position = len(modules)
+        module = modules[module_path] = [position, position, module_hash,
+                                         dependencies_resolver, name, True]
+        stack.append(module_path)
+
+        for dep in sorted(dependencies_resolver.result):
+            if dep in modules:
+                dep_module = modules[dep]
+                if dep_module[5]:
+                    module[1] = min(module[1], dep_module[0])
+            elif dep not in self.created:
+                try:
+                    self._visit(dep, dependencies_resolver.names[dep],
+                                modules, stack)
+                # FIXME: this only happens on windows, maybe we could do
+                # better?
+                except UnicodeDecodeError:
+                    continue
+                module[1] = min(module[1], modules[dep][1])
+
+        if module[1] == position:
+            component = stack[position:]
+            del stack[position:]
+            for path in component:
+                modules[path][5] = False
+            self._create(component, modules)
+
+    def _dependency_hash(self, dep):
+        dep_key = self.created[dep]
+        if self.summarize is None:
+            return dep_key.module_hash
+        summary = self.summarize(dep, dep_key) or {}
+        return json.dumps([dep_key.name, sorted(summary.items())])
+
+    def _create(self, component, modules):
+        members = set(component)
+        # modules whose key is still in process, imported through a module
+        # that is not found by the DependenciesResolver, are not taken into
+        # account
+        deps = {path: sorted(dep
+                             for dep in modules[path][3].result
+                             if dep not in members and
+                             self.created.get(dep) is not None)
+                for path in component}
+
+        mode = ['summaries'] if self.summarize is not None else []
+        if len(component) == 1:
+            path, = component
+            shared = [self._dependency_hash(dep) for dep in deps[path]]
+        else:
+            imported = sorted(set().union(*deps.values()))
+            shared = ['cycle']
+            shared.extend(modules[path][2] for path in sorted(component))
+            shared.extend(self._dependency_hash(dep) for dep in imported)
 
-                module_hash = hashlib.sha256(module_content).hexdigest()
+        for path in component:
+            _, _, module_hash, dependencies_resolver, name, _ = modules[path]
+            # keys from both modes must never collide
+            key = self.keycls([module_hash] + mode + shared,
+                              dependencies_resolver.result)
+            key.name = name
+            self.created[path] = key
 
-                hashes = [module_hash]
 
-                for new_dep in sorted(new_deps):
-                    try:
-                        new_dep_key = factory(new_dep)
-                    # FIXME: this only happens on windows, maybe we could do
-                    # better?
-                    except UnicodeDecodeError:
-                        continue
-                    hashes.append(new_dep_key.module_hash)
+def _entry_stamp(path):
+    '''
+    Size and modification time of the file at `path', or None if they may
+    not tell whether the file changed.
+    '''
+    try:
+        stat = os.stat(path)
+    except OSError:
+        return None
+    # the file may still change without its modification time changing
+    if is_racy(stat.st_mtime_ns):
+        return None
+    return [stat.st_size, stat.st_mtime_ns]
 
-                self.module_hash = hashlib.sha256("".join(hashes).encode("ascii")).hexdigest()
 
-        @property
-        def path(self):
-            return self.name.replace('.', os.path.sep)
+class SharedCache(object):
+    '''
+    Declarative cache entries, installed in `sys.prefix/share/memestra'.
 
-    def __init__(self):
-        super(RecursiveCacheKeyFactory, self).__init__(RecursiveCacheKeyFactory.CacheKey)
+    The entries are indexed along with their content in the JSON file at
+    `index_path', if given. The index is reused as long as the directories
+    it was built from keep the same modification time, and entries whose
+    size or modification time changed are loaded again.
+    '''
 
+    version = 2
 
-class SharedCache(object):
+    def __init__(self, shared_dir=None, index_path=None):
+        if shared_dir is None:
+            shared_dir = os.path.join(sys.prefix, 'share', 'memestra')
+        self.shared_dir = shared_dir
 
-    def __init__(self):
-        shared_dir = os.path.join(sys.prefix, 'share', 'memestra')
-        self.cache_entries = {}
+        index = None
+        if index_path is not None:
+            indexes = load_json(index_path, SharedCache.version) or {}
+            index = indexes.get(shared_dir)
+            if index is not None and \
+               any(_dir_stamp(path) != stamp for path, stamp in index['dirs']):
+                index = None
+
+        if index is None:
+            index = self._build()
+            modified = True
+        else:
+            # entries may be edited in place, which doesn't change the
+            # modification time of their directory
+            modified = False
+            entries = index['entries']
+            for key, (path, stamp, _) in entries.items():
+                if stamp is None or stamp != _entry_stamp(path):
+                    entries[key] = self._load_entry(path)
+                    modified = True
+
+        # don't persist an index of directories that may still change
+        if modified and index_path is not None and \
+           not any(is_racy(stamp) for _, stamp in index['dirs']):
+            self._save(index_path, index)
+
+        # maps each key to the path of the entry, its stamp and its content,
+        # if known
+        self.cache_entries = index['entries']
 
-        for root, dirs, files in os.walk(shared_dir):
+    @staticmethod
+    def _load_entry(path):
+        stamp = _entry_stamp(path)
+        try:
+            with open(path, 'r') as yaml_fd:
+                data = yaml.load(yaml_fd, Loader=SafeLoader)
+        except (OSError, yaml.YAMLError):
+            # reported when the entry is used
+            data = None
+        return [path, stamp, data]
+
+    def _build(self):
+        shared_dir = self.shared_dir
+        dirs = [[shared_dir, _dir_stamp(shared_dir)]]
+        entries = {}
+        for root, _, files in os.walk(shared_dir):
+            if root != shared_dir:
+                dirs.append([root, _dir_stamp(root)])
             for fname in files:
                 if not fname.endswith('.yml'):
                     continue
-                # Not loading all entries on startup,
-                # doing it lazily upon __getitem__
 
                 if fname == '__init__.yml':
                     key = root[1 + len(shared_dir):]
                 else:
                     key = os.path.join(root[1 + len(shared_dir):], fname[:-4])
-                self.cache_entries[key] = os.path.join(root, fname)
+                entries[key] = self._load_entry(os.path.join(root, fname))
+        return {'dirs': dirs, 'entries': entries}
+
+    def _save(self, index_path, index):
+        # indexes of other environments sharing the cache are preserved
+        indexes = load_json(index_path, SharedCache.version) or {}
+        indexes[self.shared_dir] = index
+        try:
+            dump_json(index_path, SharedCache.version, indexes)
+        except (TypeError, ValueError):
+            # some entry cannot be represented in JSON
+            pass
 
     def __contains__(self, key):
         return key in self.cache_entries
 
     def __getitem__(self, key):
-        cache_path = self.cache_entries[key]
-        with open(cache_path, 'r') as yaml_fd:
-            return yaml.load(yaml_fd, Loader=yaml.SafeLoader)
+        cache_path, _, data = self.cache_entries[key]
+        if data is None:
+            with open(cache_path, 'r') as yaml_fd:
+                data = yaml.load(yaml_fd, Loader=SafeLoader)
+        return data
+
+    def get(self, key, default=None):
+        if key not in self.cache_entries:
+            return default
+        return self[key]
 
     def keys(self):
         return self.cache_entries.keys()
 
 
+# Shared caches loaded by this process, per directory
+shared_caches = {}
+
+
+def load_shared_cache(index_path=None, reload=False):
+    '''
+    Return the SharedCache of the current environment, loading it only once
+    per process unless `reload' is set.
+    '''
+    shared_dir = os.path.join(sys.prefix, 'share', 'memestra')
+    if reload or shared_dir not in shared_caches:
+        shared_caches[shared_dir] = SharedCache(shared_dir, index_path)
+    return shared_caches[shared_dir]
+
+
+class YamlBackend(object):
+    '''
+    Store each cache entry as a YAML file, named after the entry key, in a
+    flat directory. The modification time of a file records the last use of
+    the entry.
+    '''
+
+    def __init__(self, cachedir):
+        self.cachedir = cachedir
+
+    def _get_path(self, key):
+        return os.path.join(self.cachedir, key)
+
+    def __contains__(self, key):
+        return os.path.isfile(self._get_path(key))
+
+    def __getitem__(self, key):
+        with open(self._get_path(key), 'r') as yaml_fd:
+            return yaml.load(yaml_fd, Loader=SafeLoader)
+
+    def get(self, key, default=None):
+        try:
+            return self[key]
+        except FileNotFoundError:
+            return default
+
+    def __setitem__(self, key, data):
+        # Write to a temporary file first, so that concurrent readers never
+        # see a partially written entry.
+        tmp_fd, tmp_path = tempfile.mkstemp(dir=self.cachedir, prefix='.')
+        with os.fdopen(tmp_fd, 'w') as yaml_fd:
+            yaml.dump(data, yaml_fd, Dumper=SafeDumper)
+        os.replace(tmp_path, self._get_path(key))
+
+    def keys(self):
+        # hidden files are not cache entries
+        return [key for key in os.listdir(self.cachedir)
+                if not key.startswith('.')]
+
+    def items(self):
+        for key in self.keys():
+            yield key, self[key]
+
+    def clear(self):
+        count = 0
+        for key in self.keys():
+            os.remove(self._get_path(key))
+            count += 1
+        return count
+
+    def stats(self):
+        '''
+        Yield the key, size in bytes and last use time of each entry.
+        '''
+        for entry in os.scandir(self.cachedir):
+            if entry.name.startswith('.'):
+                continue
+            try:
+                stat = entry.stat()
+            except FileNotFoundError:
+                continue
+            yield entry.name, stat.st_size, stat.st_mtime
+
+    def touch(self, keys):
+        '''
+        Record that the entries of `keys' have just been used.
+        '''
+        for key in keys:
+            try:
+                os.utime(self._get_path(key))
+            except FileNotFoundError:
+                pass
+
+    def remove(self, keys):
+        for key in keys:
+            try:
+                os.remove(self._get_path(key))
+            except FileNotFoundError:
+                pass
+
+
+class SqliteBackend(object):
+    '''
+    Store all cache entries in a single SQLite database, as JSON documents.
+    '''
+
+    filename = '.entries.sqlite'
+
+    def __init__(self, cachedir):
+        import sqlite3
+        self.path = os.path.join(cachedir, SqliteBackend.filename)
+        # autocommit, and wait for concurrent writers
+        self.db = sqlite3.connect(self.path, timeout=60,
+                                  isolation_level=None)
+        self.db.execute('PRAGMA journal_mode=WAL')
+        self.db.execute('PRAGMA synchronous=NORMAL')
+        self.db.execute('CREATE TABLE IF NOT EXISTS entries '
+                        '(key TEXT PRIMARY KEY, data TEXT NOT NULL, '
+                        'atime REAL NOT NULL DEFAULT 0)')
+        # databases created before last use times were recorded
+        columns = [column[1] for column in
+                   self.db.execute('PRAGMA table_info(entries)')]
+        if 'atime' not in columns:
+            self.db.execute('ALTER TABLE entries '
+                            'ADD COLUMN atime REAL NOT NULL DEFAULT 0')
+
+    def __contains__(self, key):
+        cursor = self.db.execute('SELECT 1 FROM entries WHERE key = ?',
+                                 (key,))
+        return cursor.fetchone() is not None
+
+    def __getitem__(self, key):
+        data = self.get(key)
+        if data is None:
+            raise KeyError(key)
+        return data
+
+    def get(self, key, default=None):
+        cursor = self.db.execute('SELECT data FROM entries WHERE key = ?',
+                                 (key,))
+        row = cursor.fetchone()
+        if row is None:
+            return default
+        return json.loads(row[0])
+
+    def __setitem__(self, key, data):
+        self.db.execute('INSERT OR REPLACE INTO entries VALUES (?, ?, ?)',
+                        (key, json.dumps(data), time.time()))
+
+    def keys(self):
+        return [key for key, in self.db.execute('SELECT key FROM entries')]
+
+    def items(self):
+        for key, data in self.db.execute('SELECT key, data FROM entries'):
+            yield key, json.loads(data)
+
+    def clear(self):
+        return self.db.execute('DELETE FROM entries').rowcount
+
+    def stats(self):
+        return self.db.execute('SELECT key, length(data), atime '
+                               'FROM entries').fetchall()
+
+    def touch(self, keys):
+        now = time.time()
+        with self.db:
+            self.db.execute('BEGIN')
+            self.db.executemany('UPDATE entries SET atime = ? WHERE key = ?',
+                                ((now, key) for key in keys))
+
+    def remove(self, keys):
+        with self.db:
+            self.db.execute('BEGIN')
+            self.db.executemany('DELETE FROM entries WHERE key = ?',
+                                ((key,) for key in keys))
+
+
+backends = {'yaml': YamlBackend, 'sqlite': SqliteBackend}
+
+
 class Cache(object):
 
-    def __init__(self, cache_dir=None):
-        self.shared_cache = SharedCache()
+    default_memory_size = 4096
+
+    # version of the automatic garbage collection policy format
+    gc_version = 1
+    # version of the storage backend record format
+    backend_version = 1
+    # minimal delay between two automatic garbage collections, in seconds
+    gc_interval = 3600
+
+    def __init__(self, cache_dir=None, backend=None, memory_size=None):
+        '''
+        Create a cache stored in `cache_dir', or in a default user directory.
+
+        `backend' is the name of the storage backend, one of the keys of
+        `backends', defaulting to the one recorded by `set_backend', or to
+        'yaml'.
+
+        The last `memory_size' entries used are kept in memory, in front of
+        both the storage backend and the shared cache.
+        '''
+        if memory_size is None:
+            memory_size = Cache.default_memory_size
+        self.memory_size = memory_size
+        self.memory = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        # backend entries read since the last flush
+        self.used = set()
 
         if cache_dir is not None:
             self.cachedir = cache_dir
@@ -268,58 +843,187 @@ class Cache(object):
             self.cachedir = os.path.expanduser(os.path.join(user_config_dir,
                                                             memestra_dir))
         os.makedirs(self.cachedir, exist_ok=True)
+        self.shared_cache = load_shared_cache(self.metadata_path('shared.json'))
 
-    def _get_path(self, key):
-        return os.path.join(self.cachedir, key.module_hash)
+        if backend is None:
+            backend = load_json(self.metadata_path('backend.json'),
+                                Cache.backend_version) or 'yaml'
+        if backend not in backends:
+            raise ValueError(
+                "Invalid cache backend, should be one of {}"
+                .format(', '.join(sorted(backends))))
+        self.backend = backends[backend](self.cachedir)
+
+    def metadata_path(self, name):
+        '''
+        Path to auxiliary data named `name', stored along the cache entries.
+        '''
+        return os.path.join(self.cachedir, '.' + name)
+
+    def _remember(self, memory_key, data):
+        if not self.memory_size:
+            return
+        self.memory[memory_key] = data
+        self.memory.move_to_end(memory_key)
+        if len(self.memory) > self.memory_size:
+            self.memory.popitem(last=False)
+            self.evictions += 1
+            stats.count('cache evictions')
+
+    def get(self, key, default=None):
+        '''
+        Return the entry associated to `key', or `default' if there's none.
+        The returned entry must not be modified.
+        '''
+        memory_key = key.path, key.module_hash
+        data = self.memory.get(memory_key)
+        if data is not None:
+            self.memory.move_to_end(memory_key)
+            # the memory may outlive several flushes, e.g. in a daemon
+            if key.path not in self.shared_cache:
+                self.used.add(key.module_hash)
+            self.hits += 1
+            stats.count('cache hits')
+            return data
+
+        self.misses += 1
+        data = self.shared_cache.get(key.path)
+        if data is None:
+            with stats.timer('cache I/O'):
+                data = self.backend.get(key.module_hash)
+            if data is not None:
+                self.used.add(key.module_hash)
+        if data is None:
+            stats.count('cache misses')
+            return default
+        stats.count('cache hits')
+        self._remember(memory_key, data)
+        return data
 
     def __contains__(self, key):
-        if key.path in self.shared_cache:
-            return True
-        cache_path = self._get_path(key)
-        return os.path.isfile(cache_path)
+        return self.get(key) is not None
 
     def __getitem__(self, key):
-        if key.path in self.shared_cache:
-            return self.shared_cache[key.path]
-        cache_path = self._get_path(key)
-        with open(cache_path, 'r') as yaml_fd:
-            return yaml.load(yaml_fd, Loader=yaml.SafeLoader)
+        data = self.get(key)
+        if data is None:
+            raise KeyError(key.module_hash)
+        return data
 
     def __setitem__(self, key, data):
         data = data.copy()
         Format.setdefaults(data, name=key.name)
         Format.check(data)
-        cache_path = self._get_path(key)
-        with open(cache_path, 'w') as yaml_fd:
-            yaml.dump(data, yaml_fd)
+        stats.count('cache stores')
+        with stats.timer('cache I/O'):
+            self.backend[key.module_hash] = data
+        if key.path not in self.shared_cache:
+            self._remember((key.path, key.module_hash), data)
 
     def keys(self):
-        return os.listdir(self.cachedir)
+        return self.backend.keys()
 
     def items(self):
-        for key in self.keys():
-            cache_path = os.path.join(self.cachedir, key)
-            with open(cache_path, 'r') as yaml_fd:
-                yield key, yaml.load(yaml_fd, Loader=yaml.SafeLoader)
-
+        return self.backend.items()
 
     def shared_items(self):
         for key in self.shared_cache.keys():
             yield key, self.shared_cache[key]
 
     def clear(self):
-        count = 0
-        for key in self.keys():
-            cache_path = os.path.join(self.cachedir, key)
-            os.remove(cache_path)
-            count += 1
-        return count
+        self.memory.clear()
+        return self.backend.clear()
+
+    def reload_shared_cache(self):
+        '''
+        Take into account changes to the declarative cache since it has been
+        loaded by this process.
+        '''
+        self.shared_cache = load_shared_cache(
+            self.metadata_path('shared.json'),
+            reload=True)
+
+    def flush(self):
+        '''
+        Record the use of the entries read since the last flush, so that the
+        garbage collector considers them as recently used.
+        '''
+        if self.used:
+            with stats.timer('cache I/O'):
+                self.backend.touch(self.used)
+            self.used.clear()
+
+    def gc(self, max_size=None, max_entries=None, max_age=None, since=None):
+        '''
+        Remove the least recently used entries of the automatic cache, until
+        there are at most `max_entries' entries taking at most `max_size'
+        bytes, and remove the entries not used for `max_age' seconds.
+
+        Entries used or created after timestamp `since' are never removed.
+        Return the number of removed entries.
+        '''
+        self.flush()
+        entries = sorted(self.backend.stats(), key=lambda entry: entry[2])
+        count = len(entries)
+        total_size = sum(size for _, size, _ in entries)
+        expiration = None if max_age is None else time.time() - max_age
+
+        # file systems record times with a clock coarser than time.time()
+        if since is not None:
+            since -= 1
+
+        removed = []
+        for key, size, last_use in entries:
+            if since is not None and last_use >= since:
+                break
+            if not ((expiration is not None and last_use < expiration) or
+                    (max_entries is not None and count > max_entries) or
+                    (max_size is not None and total_size > max_size)):
+                break
+            removed.append(key)
+            count -= 1
+            total_size -= size
+
+        self.backend.remove(removed)
+        return len(removed)
+
+    def set_gc_policy(self, **limits):
+        '''
+        Set the limits applied by the automatic garbage collection, disabling
+        it if no limit is given.
+        '''
+        limits = {k: v for k, v in limits.items() if v is not None}
+        dump_json(self.metadata_path('gc.json'), Cache.gc_version,
+                  {'limits': limits, 'last_run': time.time()})
+
+    def set_backend(self, backend):
+        '''
+        Make `backend' the storage backend used when none is specified.
+        '''
+        dump_json(self.metadata_path('backend.json'), Cache.backend_version,
+                  backend)
+
+    def auto_gc(self, since):
+        '''
+        Apply the automatic garbage collection policy, unless it's disabled or
+        it has been applied in the last `gc_interval' seconds. Entries used
+        after timestamp `since' are never removed. Return the number of
+        removed entries.
+        '''
+        path = self.metadata_path('gc.json')
+        policy = load_json(path, Cache.gc_version)
+        if not policy or not policy['limits']:
+            return 0
+        if time.time() - policy['last_run'] < Cache.gc_interval:
+            return 0
+        policy['last_run'] = time.time()
+        dump_json(path, Cache.gc_version, policy)
+        return self.gc(since=since, **policy['limits'])
 
 
 def run_set(args):
     data = {'generator': 'manual',
             'deprecated': args.deprecated}
-    cache = Cache(cache_dir=args.cache_dir)
+    cache = Cache(cache_dir=args.cache_dir, backend=args.cache_backend)
     if args.recursive:
         key_factory = RecursiveCacheKeyFactory()
     else:
@@ -329,7 +1033,7 @@ def run_set(args):
 
 
 def run_list(args):
-    cache = Cache(cache_dir=args.cache_dir)
+    cache = Cache(cache_dir=args.cache_dir, backend=args.cache_backend)
     print('declarative cache')
     print('-----------------')
     for k, v in cache.shared_items():
@@ -342,16 +1046,141 @@ def run_list(args):
 
 
 def run_clear(args):
-    cache = Cache(cache_dir=args.cache_dir)
+    cache = Cache(cache_dir=args.cache_dir, backend=args.cache_backend)
     nb_cleared = cache.clear()
     print('Cache cleared, {} element{} removed.'.format(nb_cleared, 's' *
                                                         (nb_cleared > 1)))
 
 
+def run_migrate(args):
+    source = Cache(cache_dir=args.cache_dir, backend=args.cache_backend)
+    if isinstance(source.backend, backends[args.target]):
+        # both would be the same store, clearing the source loses everything
+        raise ValueError('the cache already uses the {} backend'
+                         .format(args.target))
+    target = backends[args.target](source.cachedir)
+    count = 0
+    for key, data in source.items():
+        target[key] = data
+        count += 1
+    source.set_backend(args.target)
+    # entries are only removed once they have all been written
+    if not args.keep:
+        source.clear()
+    print('Cache migrated, {} element{} moved.'.format(count, 's' *
+                                                       (count > 1)))
+
+
+def run_affected(args):
+    cache = Cache(cache_dir=args.cache_dir, backend=args.cache_backend)
+    graph = DependencyGraph(cache.metadata_path('dependencies.json'))
+    affected = graph.affected(os.path.abspath(path) for path in args.paths)
+    for path in sorted(affected):
+        print(path)
+
+
+def parse_size(value):
+    '''
+    Parse a size in bytes, with an optional K, M or G suffix.
+    '''
+    units = {'K': 2 ** 10, 'M': 2 ** 20, 'G': 2 ** 30}
+    value = value.strip().upper()
+    if value[-1:] in units:
+        return int(float(value[:-1]) * units[value[-1]])
+    return int(value)
+
+
+def parse_duration(value):
+    '''
+    Parse a duration in seconds, with an optional s, m, h or d suffix.
+    '''
+    units = {'s': 1, 'm': 60, 'h': 3600, 'd': 86400}
+    value = value.strip().lower()
+    if value[-1:] in units:
+        return float(value[:-1]) * units[value[-1]]
+    return float(value)
+
+
+def run_gc(args):
+    cache = Cache(cache_dir=args.cache_dir, backend=args.cache_backend)
+    limits = {'max_size': args.max_size,
+              'max_entries': args.max_entries,
+              'max_age': args.max_age}
+    if args.auto:
+        cache.set_gc_policy(**limits)
+    nb_removed = cache.gc(**limits)
+    print('Cache collected, {} element{} removed.'.format(nb_removed, 's' *
+                                                          (nb_removed > 1)))
+
+
+# version of the format recording the progress of `memestra-cache warm'
+warm_version = 1
+
+
+def run_warm(args):
+    from memestra.memestra import warm_cache
+    from memestra.utils import iter_modules
+
+    cache = Cache(cache_dir=args.cache_dir, backend=args.cache_backend)
+    progress_path = cache.metadata_path('warm.json')
+    config = [args.decorator, args.reason_keyword, args.recursive,
+              sorted(args.packages)]
+
+    done = set()
+    if args.resume:
+        progress = load_json(progress_path, warm_version)
+        if progress and progress['config'] == config:
+            done.update(progress['done'])
+
+    try:
+        module_names = [module_name for module_name in
+                        iter_modules(args.packages or None)
+                        if module_name not in done]
+    except ValueError as e:
+        print(e, file=sys.stderr)
+        sys.exit(1)
+
+    def save_progress():
+        dump_json(progress_path, warm_version,
+                  {'config': config, 'done': sorted(done)})
+
+    verbose = sys.stderr.isatty()
+    nb_failed = 0
+    summaries = warm_cache(module_names,
+                           args.decorator.split('.'),
+                           args.reason_keyword,
+                           args.recursive,
+                           args.cache_dir,
+                           args.jobs,
+                           backend=args.cache_backend)
+    try:
+        for count, (module_name, error) in enumerate(summaries, 1):
+            done.add(module_name)
+            if error is not None:
+                nb_failed += 1
+                print('{}failed to summarize {}: {}'.format(
+                    '\r' if verbose else '', module_name, error),
+                    file=sys.stderr)
+            if verbose:
+                print('\r[{}/{}] {}\033[K'.format(count, len(module_names),
+                                                  module_name),
+                      end='', file=sys.stderr)
+            if count % 100 == 0:
+                save_progress()
+    finally:
+        save_progress()
+        if verbose:
+            print(file=sys.stderr)
+
+    nb_warmed = len(module_names) - nb_failed
+    print('Cache warmed, {} module{} summarized, {} failed.'.format(
+        nb_warmed, 's' * (nb_warmed > 1), nb_failed))
+
+
 def run_docparse(args):
     deprecated = docparse(args.input, args.pattern)
 
-    cache = Cache(cache_dir=args.cache_dir)
+    cache = Cache(cache_dir=args.cache_dir, backend=args.cache_backend)
     if args.recursive:
         key_factory = RecursiveCacheKeyFactory()
     else:
@@ -378,6 +1207,9 @@ def run():
                         default=None,
                         action='store',
                         help='The directory where the cache is located')
+    parser.add_argument('--cache-backend', dest='cache_backend',
+                        default=None, choices=sorted(backends),
+                        help='The storage backend of the cache')
 
     parser_set = subparsers.add_parser('set', help='Set a cache entry')
     parser_set.add_argument('--deprecated', dest='deprecated',
@@ -396,6 +1228,63 @@ def run():
                                          help='Remove all cache entries')
     parser_clear.set_defaults(runner=run_clear)
 
+    parser_migrate = subparsers.add_parser(
+        'migrate',
+        help='Move cache entries to another storage backend')
+    parser_migrate.add_argument('--keep', action='store_true',
+                                help='keep the entries in the source backend')
+    parser_migrate.add_argument('target', choices=sorted(backends),
+                                help='target storage backend')
+    parser_migrate.set_defaults(runner=run_migrate)
+
+    parser_gc = subparsers.add_parser(
+        'gc',
+        help='Remove the least recently used cache entries')
+    parser_gc.add_argument('--max-size', type=parse_size,
+                           help='maximal size of the cache, in bytes, with '
+                                'an optional K, M or G suffix')
+    parser_gc.add_argument('--max-entries', type=int,
+                           help='maximal number of cache entries')
+    parser_gc.add_argument('--max-age', type=parse_duration,
+                           help='remove entries unused for that duration, '
+                                'in seconds, with an optional s, m, h or d '
+                                'suffix')
+    parser_gc.add_argument('--auto', action='store_true',
+                           help='also apply these limits at the end of each '
+                                'scan, at most once an hour; disable it if '
+                                'no limit is given')
+    parser_gc.set_defaults(runner=run_gc)
+
+    parser_warm = subparsers.add_parser(
+        'warm',
+        help='Summarize all the importable modules, or the given packages')
+    parser_warm.add_argument('--decorator', dest='decorator',
+                             default='deprecated.deprecated',
+                             help='Path to the decorator to check')
+    parser_warm.add_argument('--reason-keyword', dest='reason_keyword',
+                             default='reason',
+                             help='Specify keyword for deprecation reason')
+    parser_warm.add_argument('--recursive', action='store_true',
+                             help='Traverse the whole module hierarchy')
+    parser_warm.add_argument('-j', '--jobs', dest='jobs',
+                             default=0, type=int,
+                             help='Number of modules summarized in parallel, '
+                                  '0 means one per CPU')
+    parser_warm.add_argument('--resume', action='store_true',
+                             help='skip the modules processed by a previous, '
+                                  'interrupted, run with the same options')
+    parser_warm.add_argument('packages', nargs='*',
+                             help='packages or modules to summarize, along '
+                                  'with their submodules')
+    parser_warm.set_defaults(runner=run_warm)
+
+    parser_affected = subparsers.add_parser(
+        'affected',
+        help='List the files affected by changes to the given files')
+    parser_affected.add_argument('paths', nargs='+',
+                                 help='changed files')
+    parser_affected.set_defaults(runner=run_affected)
+
     parser_docparse = subparsers.add_parser(
         'docparse',
         help='Set cache entry from docstring')
@@ -412,6 +1301,9 @@ def run():
 
     args = parser.parse_args()
     if hasattr(args, 'runner'):
-        args.runner(args)
+        try:
+            args.runner(args)
+        except ValueError as e:
+            parser.error(str(e))
     else:
         parser.print_help()
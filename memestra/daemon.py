@@ -0,0 +1,242 @@
+import json
+import os
+import signal
+import socket
+import socketserver
+import sys
+import tempfile
+import threading
+import time
+
+from memestra.memestra import Scanner, load_dispatcher
+from memestra.stats import stats
+from memestra.utils import ModuleIndex
+
+# To be bumped whenever requests or responses change
+PROTOCOL_VERSION = 1
+
+
+def default_socket_path():
+    '''
+    Path of the socket the daemon of the current user listens to.
+    '''
+    runtime_dir = os.environ.get('XDG_RUNTIME_DIR') or tempfile.gettempdir()
+    return os.path.join(runtime_dir, 'memestra-{}.sock'.format(os.getuid()))
+
+
+def environment():
+    '''
+    Description of everything outside of a request that influences a scan:
+    the Python environment, which drives module resolution, and the default
+    cache location.
+    '''
+    return [ModuleIndex.environment_key(),
+            os.environ.get('XDG_CONFIG_HOME')]
+
+
+def send(socket_path, request, timeout=None):
+    '''
+    Send `request' to the daemon listening on `socket_path' and return its
+    response. Raise OSError if no daemon is listening, or if the socket
+    doesn't belong to the current user.
+    '''
+    # another user could listen to the socket and forge responses
+    if os.stat(socket_path).st_uid != os.getuid():
+        raise PermissionError('{} belongs to another user'
+                              .format(socket_path))
+    request = dict(request, version=PROTOCOL_VERSION)
+    with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as sock:
+        sock.settimeout(timeout)
+        sock.connect(socket_path)
+        sock.sendall(json.dumps(request).encode('utf-8') + b'\n')
+        with sock.makefile('rb') as fd:
+            response = fd.readline()
+    if not response:
+        raise ConnectionError('no response from {}'.format(socket_path))
+    return json.loads(response.decode('utf-8'))
+
+
+def remote_extensions(socket_path):
+    '''
+    Return the extensions of the files the daemon listening on `socket_path'
+    can scan, or None if no daemon is listening.
+    '''
+    try:
+        response = send(socket_path, {'command': 'ping'})
+    except (OSError, ValueError):
+        return None
+    extensions = response.get('extensions')
+    return None if extensions is None else set(extensions)
+
+
+def scan_files_remote(socket_path, paths, decorator, reason_keyword,
+                      recursive=False, cache_dir=None, **cache_options):
+    '''
+    Scan each file in `paths' through the daemon listening on `socket_path',
+    and return the list of deprecated uses found in each of them, as
+    `scan_files' does. Return None if no daemon is listening, or if it cannot
+    process the request. When statistics are enabled, those of the daemon
+    are merged into the statistics of the current process.
+    '''
+    abspaths = [os.path.abspath(path) for path in paths]
+    if cache_dir is not None:
+        cache_dir = os.path.abspath(cache_dir)
+    config = {'decorator': list(decorator),
+              'reason_keyword': reason_keyword,
+              'recursive': recursive,
+              'cache_dir': cache_dir,
+              'cache_options': cache_options}
+    try:
+        response = send(socket_path, {'command': 'scan',
+                                      'environment': environment(),
+                                      'config': config,
+                                      'paths': abspaths,
+                                      'stats': stats.enabled})
+    except (OSError, ValueError):
+        return None
+    if 'results' not in response:
+        return None
+    if response.get('stats'):
+        stats.merge(response['stats'])
+
+    # report files under the name they were given
+    results = []
+    for path, abspath, deprecate_uses in zip(paths, abspaths,
+                                             response['results']):
+        results.append([tuple(use[:1] +
+                              [path if use[1] == abspath else use[1]] +
+                              use[2:])
+                        for use in deprecate_uses])
+    return results
+
+
+class RequestHandler(socketserver.StreamRequestHandler):
+
+    def handle(self):
+        try:
+            request = json.loads(self.rfile.readline().decode('utf-8'))
+            response = self.server.process(request)
+        except Exception as e:
+            response = {'error': '{}: {}'.format(type(e).__name__, e)}
+        self.wfile.write(json.dumps(response).encode('utf-8') + b'\n')
+
+
+class Server(socketserver.UnixStreamServer):
+    '''
+    Process requests one at a time, with a Scanner per configuration kept
+    alive between requests, so that cache entries, module locations and the
+    loaded plugins remain in memory.
+    '''
+
+    def __init__(self, socket_path):
+        self.scanners = {}
+        self.environment = environment()
+        self.extensions = sorted({'.py'}.union(load_dispatcher()))
+        super(Server, self).__init__(socket_path, RequestHandler)
+
+    def server_bind(self):
+        super(Server, self).server_bind()
+        # only the current user may submit requests
+        os.chmod(self.server_address, 0o600)
+
+    def process(self, request):
+        if request.get('version') != PROTOCOL_VERSION:
+            return {'error': 'unsupported protocol version'}
+
+        command = request.get('command')
+        if command == 'ping':
+            return {'extensions': self.extensions}
+        if command == 'shutdown':
+            # shutdown() waits for the serving loop, which runs this request
+            threading.Thread(target=self.shutdown).start()
+            return {}
+        if command != 'scan':
+            return {'error': 'unknown command {}'.format(command)}
+
+        if request['environment'] != self.environment:
+            return {'error': 'the daemon runs in another environment'}
+
+        started = time.time()
+        # only report the statistics of this request
+        stats.clear()
+        stats.enabled = bool(request.get('stats'))
+        config = request['config']
+        config_key = json.dumps(config, sort_keys=True)
+        scanner = self.scanners.get(config_key)
+        if scanner is None:
+            scanner = Scanner(config['decorator'],
+                              config['reason_keyword'],
+                              config['recursive'],
+                              config['cache_dir'],
+                              **config['cache_options'])
+            self.scanners[config_key] = scanner
+        else:
+            scanner.refresh()
+
+        try:
+            response = {'results': [scanner.scan(path)
+                                    for path in request['paths']]}
+        finally:
+            scanner.flush()
+            scanner.session.cache.auto_gc(started)
+            stats.enabled = False
+        if request.get('stats'):
+            response['stats'] = stats.collect()
+        return response
+
+
+def serve(socket_path):
+    '''
+    Process scan requests sent to `socket_path' until a shutdown request is
+    received or the process is terminated.
+    '''
+    if os.path.exists(socket_path):
+        try:
+            send(socket_path, {'command': 'ping'}, timeout=1)
+        except PermissionError:
+            raise ValueError('{} belongs to another user'
+                             .format(socket_path))
+        except OSError:
+            # left over by a daemon that did not exit cleanly
+            os.unlink(socket_path)
+        else:
+            raise ValueError('a daemon already listens to {}'
+                             .format(socket_path))
+
+    server = Server(socket_path)
+    signal.signal(signal.SIGTERM, lambda signum, frame: sys.exit(0))
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        os.unlink(socket_path)
+
+
+def run(argv=None):
+    import argparse
+
+    parser = argparse.ArgumentParser(
+        prog='memestra serve',
+        description='Serve scan requests from a long-lived process, which '
+                    'keeps caches warm between requests.')
+    parser.add_argument('--socket', dest='socket',
+                        default=default_socket_path(),
+                        help='Path to the Unix socket to listen to')
+    parser.add_argument('--stop', action='store_true',
+                        help='Stop the daemon listening to the socket')
+
+    args = parser.parse_args(argv)
+
+    if args.stop:
+        try:
+            send(args.socket, {'command': 'shutdown'})
+        except OSError:
+            parser.error('no daemon listens to {}'.format(args.socket))
+        return
+
+    try:
+        serve(args.socket)
+    except (OSError, ValueError) as e:
+        parser.error(str(e))
@@ -1,17 +1,44 @@
+import ast as stdlib_ast
 import beniget
 import gast as ast
 import os
+import re
 import sys
 import warnings
 
 from importlib.util import resolve_name
 from collections import defaultdict
 from memestra.caching import Cache, CacheKeyFactory, RecursiveCacheKeyFactory
-from memestra.caching import Format
-from memestra.utils import resolve_module
+from memestra.caching import DependencyGraph, ImportIndex, StatIndex
+from memestra.caching import Format, backends as cache_backends
+from memestra.stats import stats
+from memestra.utils import expand_inputs, resolve_module, use_module_index
+from memestra.utils import resolution_cache
+from memestra.utils import SourceStore
 import frilouz
 
-_defs = ast.AsyncFunctionDef, ast.ClassDef, ast.FunctionDef
+def _node_types(*names):
+    # The analysis handles both gast and standard library trees
+    return tuple(getattr(module, name)
+                 for module in (ast, stdlib_ast)
+                 for name in names)
+
+_defs = _node_types('AsyncFunctionDef', 'ClassDef', 'FunctionDef')
+_alias = _node_types('alias')
+_attribute = _node_types('Attribute')
+_call = _node_types('Call')
+_import_from = _node_types('ImportFrom')
+_imports = _node_types('Import', 'ImportFrom')
+_name = _node_types('Name')
+
+# Import statements, as found by a textual scan of the source
+_dotted_alias = r'[\w.]+(?:[ \t]+as[ \t]+\w+)?'
+_imports_re = re.compile(r'\bfrom[ \t]+(\.*)[ \t]*([\w.]*)[ \t]+import\b|'
+                         r'\bimport[ \t]+({0}(?:[ \t]*,[ \t]*{0})*)'
+                         .format(_dotted_alias))
+
+# Fields holding the nested statements of a statement
+_stmt_fields = 'body', 'orelse', 'finalbody', 'handlers', 'cases'
 
 class DeprecatedStar(object):
     'Representation of a deprecated node imported through *'
@@ -48,17 +75,296 @@ class SilentDefUseChains(beniget.DefUseChains):
         pass
 
 
-class SilentDefUseChains(beniget.DefUseChains):
+def _supports_stdlib_trees():
+    # Recent beniget computes def-use chains on standard library trees as
+    # well, which saves the conversion to gast. Older ones fail on them, or
+    # miss some uses.
+    module = stdlib_ast.parse('x = 1\nx')
+    duc = SilentDefUseChains()
+    try:
+        duc.visit(module)
+        return len(duc.chains[module.body[0].targets[0]].users()) == 1
+    except Exception:
+        return False
 
-    def unbound_identifier(self, name, node):
-        pass
+# Analysis relies on ast.Constant, which is only generated since Python 3.8
+HAS_STDLIB_ENGINE = sys.version_info >= (3, 8) and _supports_stdlib_trees()
+
+
+def parse(code, use_stdlib_ast=HAS_STDLIB_ENGINE):
+    '''
+    Parse `code', resilient to syntax errors, into a standard library tree if
+    `use_stdlib_ast' is set and the stdlib engine is available, into a gast
+    tree otherwise.
+    '''
+    stats.count('modules parsed')
+    with stats.timer('parse'):
+        if use_stdlib_ast and HAS_STDLIB_ENGINE:
+            module, _ = frilouz.parse(stdlib_ast.parse, code)
+        else:
+            module, _ = frilouz.parse(ast.parse, code)
+    return module
+
+
+def iter_imports(node):
+    '''
+    Yield the import statements nested in `node', in order, without walking
+    through expressions.
+    '''
+    for field in _stmt_fields:
+        for child in getattr(node, field, ()):
+            if isinstance(child, _imports):
+                yield child
+            else:
+                yield from iter_imports(child)
+
+
+def analyze(module):
+    '''
+    Compute the def-use chains and the ancestors of `module', either a gast
+    or, if the stdlib engine is available, a standard library tree.
+    '''
+    duc, ancestors = SilentDefUseChains(), beniget.Ancestors()
+    stats.count('modules analyzed')
+    with stats.timer('def-use'):
+        duc.visit(module)
+        ancestors.visit(module)
+    return duc, ancestors
+
+
+class SummaryStack(object):
+    '''
+    Modules being summarized within a session, innermost last.
+
+    The modules of an import cycle depend on each other, so they are
+    summarized together. A module imported again while it's being summarized
+    is seen with the summary found by the previous attempt, empty at first.
+    Once the first module of the cycle to be entered is summarized, the whole
+    cycle is summarized again, until no summary changes. Summaries only grow
+    from one attempt to the next, so the outcome doesn't depend on the module
+    the cycle has been entered from, nor on the summaries already known.
+    '''
+
+    def __init__(self, visited):
+        # key, path, lowest position reached and whether the module has been
+        # imported again, per module being summarized
+        self.frames = []
+        self.positions = {}
+        # path, summary and lowest position reached of the modules of a
+        # cycle summarized by the current attempt
+        self.members = {}
+        # summaries found by the previous attempt
+        self.previous = {}
+        self.visited = visited
+
+    def _reach(self, position):
+        frame = self.frames[-1]
+        frame[2] = min(frame[2], position)
+
+    def lookup(self, key):
+        '''
+        Return the current summary of `key' if it's part of a cycle being
+        summarized, None otherwise.
+        '''
+        position = self.positions.get(key)
+        if position is not None:
+            self.frames[position][3] = True
+            self._reach(position)
+            return self.previous.get(key, {})
+        member = self.members.get(key)
+        if member is not None:
+            _, summary, low = member
+            self._reach(low)
+            return summary
+        return None
+
+    def push(self, key, path):
+        self.positions[key] = len(self.frames)
+        self.frames.append([key, path, len(self.frames), False])
+
+    def pop(self):
+        key, _, low, _ = self.frames.pop()
+        del self.positions[key]
+        if self.frames:
+            self._reach(low)
+        else:
+            # nothing left from an interrupted attempt
+            self.members.clear()
+            self.previous.clear()
+
+    def complete(self, summary):
+        '''
+        Record `summary' for the innermost module. Return the summaries that
+        are final, as (key, summary) pairs, none if the module belongs to a
+        cycle entered from an outer module. Return None if the cycle entered
+        from this module must be summarized again.
+        '''
+        position = len(self.frames) - 1
+        frame = self.frames[position]
+        key, path, low, cyclic = frame
+        if low < position:
+            # members reaching this module now reach the same outer module
+            for member_key, (member_path, member_summary, member_low) in \
+                    list(self.members.items()):
+                if member_low >= position:
+                    self.members[member_key] = (member_path, member_summary,
+                                                low)
+            self.members[key] = path, summary, low
+            return []
+        if not cyclic:
+            return [(key, summary)]
+
+        # members of the cycle entered from this module only reach it, the
+        # other ones belong to a cycle entered from an outer module
+        cycle = [(key, path, summary)]
+        for member_key, (member_path, member_summary, member_low) in \
+                list(self.members.items()):
+            if member_low >= position:
+                cycle.append((member_key, member_path, member_summary))
+                del self.members[member_key]
+
+        # identifiers found by previous attempts are kept, which guarantees
+        # that the summaries eventually stop changing
+        converged = True
+        for k, _, s in cycle:
+            previous = self.previous.get(k)
+            if previous is not None:
+                s = dict(s)
+                s.update(previous)
+            if s != previous:
+                converged = False
+                self.previous[k] = s
+
+        if converged:
+            return [(k, self.previous.pop(k)) for k, _, _ in cycle]
+
+        for _, p, _ in cycle:
+            self.visited.discard(p)
+        frame[2:] = position, False
+        return None
+
+
+class ResolverSession(object):
+    '''
+    State shared by all the ImportResolver involved in a scan: the cache
+    handle, the cache key factory, the set of visited modules and module
+    summaries. Module resolution results are memoized process-wide by
+    `resolve_module'.
+
+    A single session can be reused across several calls to `memestra', as
+    long as they all use the same `recursive' and cache settings.
+    '''
+
+    def __init__(self, recursive=False, cache_dir=None, strict_hashing=False,
+                 early_cutoff=False, **cache_options):
+        '''
+        Unless `strict_hashing' is set, module content is only hashed when
+        its stat fingerprint changes. If `early_cutoff' is set, recursive
+        cache keys depend on the summaries of the imported modules rather
+        than on their content. `cache_options' are forwarded to the Cache
+        constructor.
+        '''
+        self.recursive = recursive
+        self.early_cutoff = early_cutoff
+        self.cache = Cache(cache_dir=cache_dir, **cache_options)
+        self.visited = set()
+        if strict_hashing:
+            self.stat_index = None
+        else:
+            self.stat_index = StatIndex(
+                self.cache.metadata_path('fingerprints.json'))
+        self.import_index = ImportIndex(
+            self.cache.metadata_path('imports.json'))
+        self.prefiltered = 0
+        # paths of the modules each scanned file or module depends on, and
+        # the stack of files being processed
+        self.dependencies = defaultdict(set)
+        self.importers = []
+        self._reset()
+        self.module_index = use_module_index(
+            self.cache.metadata_path('modules.json'))
+        self.graph = DependencyGraph(
+            self.cache.metadata_path('dependencies.json'))
+
+    def _reset(self):
+        self.visited.clear()
+        self.summary_stack = SummaryStack(self.visited)
+        self.sources = SourceStore()
+        if self.recursive:
+            # in early-cutoff mode, the summarizer is set by the resolvers
+            # using the session
+            self.key_factory = RecursiveCacheKeyFactory(self.stat_index,
+                                                        self.sources,
+                                                        self.import_index)
+        else:
+            self.key_factory = CacheKeyFactory(self.stat_index, self.sources)
+        self.summaries = {}
+
+    def refresh(self):
+        '''
+        Forget the state that files modified since the session started may
+        have made obsolete, so that a long-lived session can be reused. The
+        cache handle, the stat index, the import index and the module index
+        are kept, as they
+        check the validity of their entries on their own.
+        '''
+        self._reset()
+        self.cache.reload_shared_cache()
+        resolution_cache.clear()
+        self.module_index = use_module_index(self.module_index.path)
+        self.module_index.reload()
+
+    def dependency_graph(self):
+        '''
+        Map the path of each scanned file or module to the paths of the
+        modules it depends on, as far as the session knows.
+        '''
+        graph = {path: set(deps) for path, deps in self.dependencies.items()}
+        for path, key in self.key_factory.created.items():
+            deps = getattr(key, 'dependencies', None)
+            if deps:
+                graph.setdefault(path, set()).update(deps)
+        return graph
+
+    def invalidate(self, paths):
+        '''
+        Forget what the session knows about the files at `paths', and about
+        the modules that depend on them, directly or not. Return the paths of
+        all these files.
+        '''
+        self.graph.update(self.dependency_graph())
+        stale = self.graph.affected(paths)
+
+        for path in stale:
+            key = self.key_factory.created.pop(path, None)
+            self.summaries.pop(key, None)
+            self.sources.release(path)
+            self.visited.discard(path)
+            self.dependencies.pop(path, None)
+
+        # files may have been created or removed
+        resolution_cache.clear()
+        self.module_index.reload()
+        return stale
+
+    def flush(self):
+        '''
+        Persist the data gathered during the session.
+        '''
+        self.cache.flush()
+        self.graph.update(self.dependency_graph())
+        self.graph.save()
+        self.module_index.save()
+        self.import_index.save()
+        if self.stat_index is not None:
+            self.stat_index.save()
 
 
 class ImportResolver(ast.NodeVisitor):
 
     def __init__(self, decorator, reason_keyword, search_paths=None,
                  recursive=False, parent=None, pkg_name=None,
-                 cache_dir=None):
+                 cache_dir=None, session=None):
         '''
         Create an ImportResolver that finds deprecated identifiers.
 
@@ -69,6 +375,9 @@ class ImportResolver(ast.NodeVisitor):
         from imported module, with that depth in the import tree.
 
         `parent' is used internally to handle imports.
+
+        `session' is a ResolverSession shared with other resolvers, a new
+        one is created if it's not provided.
         '''
         self.deprecated = None
         self.decorator = tuple(decorator)
@@ -77,16 +386,16 @@ class ImportResolver(ast.NodeVisitor):
         self.reason_keyword = reason_keyword
         self.pkg_name = pkg_name
         if parent:
-            self.cache = parent.cache
-            self.visited = parent.visited
-            self.key_factory = parent.key_factory
+            self.session = parent.session
+        elif session:
+            self.session = session
         else:
-            self.cache = Cache(cache_dir=cache_dir)
-            self.visited = set()
-            if recursive:
-                self.key_factory = RecursiveCacheKeyFactory()
-            else:
-                self.key_factory = CacheKeyFactory()
+            self.session = ResolverSession(recursive, cache_dir)
+        self.cache = self.session.cache
+        self.visited = self.session.visited
+        self.key_factory = self.session.key_factory
+        if parent is None and self.recursive and self.session.early_cutoff:
+            self.key_factory.summarize = self.summarize_dependency
 
     def load_deprecated_from_module(self, module_name, level=None):
         # level may be none when it's taken from the ImportFrom node
@@ -107,66 +416,179 @@ class ImportResolver(ast.NodeVisitor):
         if module_path is None:
             return None
 
+        importers = self.session.importers
+        if importers:
+            self.session.dependencies[importers[-1]].add(module_path)
+
         module_key = self.key_factory(module_path, name_hint=module_name)
+        return self.load_summary(module_path, module_name, module_key)
+
+    def summarize_dependency(self, module_path, module_key):
+        '''
+        Summary of the module at `module_path', imported by a module whose
+        early-cutoff cache key is being computed.
+        '''
+        return self.load_summary(module_path, module_key.name, module_key)
+
+    def load_summary(self, module_path, module_name, module_key):
+        '''
+        Return the deprecated identifiers of module `module_name', stored at
+        `module_path', as a dict mapping them to their reason. The summary is
+        taken from the session or the cache if possible.
+        '''
+        # the key of a module is still being computed within an import cycle
+        if module_key is None:
+            return {}
+
+        importers = self.session.importers
+
+        # either find it in the session
+        summaries = self.session.summaries
+        if module_key in summaries:
+            return summaries[module_key]
 
-        # either find it in the cache
-        if module_key in self.cache:
-            data = self.cache[module_key]
+        # or among the modules of a cycle being summarized
+        stack = self.session.summary_stack
+        dl = stack.lookup(module_key)
+        if dl is not None:
+            return dl
+
+        # or in the cache
+        data = self.cache.get(module_key)
+        if data is not None:
+            # the source may have been read to compute the key
+            self.session.sources.release(module_path)
             if data['version'] == Format.version:
-                return dict(load_deprecated(entry)
-                            for entry in data['deprecated'])
+                dl = dict(load_deprecated(entry)
+                          for entry in data['deprecated'])
+                summaries[module_key] = dl
+                return dl
             elif data['generator'] == 'manual':
                 warnings.warn(
                     ("skipping module {} because it has an obsolete, "
                      "manually generated, cache file: {}")
                     .format(module_name,
                             module_key.module_hash))
+                summaries[module_key] = {}
                 return {}
 
         # or fill a new entry
 
-        # To avoid loop, mark the key as in process
-        self.cache[module_key] = {'generator': 'manual',
-                                  'deprecated': []}
+        # Summaries of the modules of an import cycle are only stored once
+        # the whole cycle is summarized, so that concurrent scans, or scans
+        # entering the cycle from another module, never see an incomplete
+        # entry.
+        stack.push(module_key, module_path)
+        importers.append(module_path)
+        try:
+            while True:
+                stats.count('modules summarized')
+                self.session.dependencies[module_path] = set()
+                dl = self.summarize_module(module_path, module_name)
+                final = stack.complete({} if dl is None else dl)
+                if final is not None:
+                    break
+        except Exception:
+            # don't try to process a faulty module again
+            self.cache[module_key] = {'generator': 'manual',
+                                      'deprecated': []}
+            raise
+        finally:
+            importers.pop()
+            stack.pop()
+
+        if dl is None:
+            self.cache[module_key] = {'generator': 'manual',
+                                      'deprecated': []}
+            summaries[module_key] = {}
+            return {}
+
+        for key, summary in final:
+            data = {'generator': 'memestra',
+                    'deprecated': [store_deprecated(d, summary[d]) for d in
+                                   sorted(summary)]}
+            self.cache[key] = data
+            summaries[key] = summary
+        return summaries.get(module_key, dl)
 
-        with open(module_path) as fd:
-            try:
-                module, syntax_errors = frilouz.parse(ast.parse, fd.read())
-            except UnicodeDecodeError:
-                return {}
-            duc = SilentDefUseChains()
-            duc.visit(module)
-            anc = beniget.Ancestors()
-            anc.visit(module)
-
-            # Collect deprecated functions
-            if self.recursive and module_path not in self.visited:
-                self.visited.add(module_path)
-                current_pkg = ".".join(module_name.split('.')[:-1])
-                resolver = ImportResolver(self.decorator,
-                                          self.reason_keyword,
-                                          self.search_paths,
-                                          self.recursive,
-                                          parent=self,
-                                          pkg_name=current_pkg)
-                resolver.visit(module)
-                deprecated_imports = [make_deprecated(d, reason)
-                                      for _, _, d, reason in
-                                      resolver.get_deprecated_users(duc, anc)]
+    def summarize_module(self, module_path, module_name):
+        '''
+        Compute the deprecated identifiers of module `module_name', stored
+        at `module_path', as a dict mapping them to their reason.
+
+        Return None if the module cannot be decoded.
+        '''
+        source = self.session.sources[module_path]
+        try:
+            if HAS_STDLIB_ENGINE:
+                module = source.tree
             else:
-                deprecated_imports = []
-            deprecated = self.collect_deprecated(module, duc, anc,
-                                                 pkg_name=module_name)
-            deprecated.update(deprecated_imports)
-            dl = {symbol_name(d[0]): d[1] for d in deprecated if d is not None}
-            data = {'generator': 'memestra',
-                    'deprecated': [store_deprecated(d, dl[d]) for d in
-                                   sorted(dl)]}
-            self.cache[module_key] = data
-            return dl
+                module = source.gast_tree
+        except (UnicodeDecodeError, SyntaxError):
+            return None
+        finally:
+            self.session.sources.release(module_path)
+
+        # Collect deprecated functions
+        if self.recursive and module_path not in self.visited:
+            self.visited.add(module_path)
+            current_pkg = ".".join(module_name.split('.')[:-1])
+            resolver = ImportResolver(self.decorator,
+                                      self.reason_keyword,
+                                      self.search_paths,
+                                      self.recursive,
+                                      parent=self,
+                                      pkg_name=current_pkg)
+            pkg_names = [module_name, current_pkg, None]
+        else:
+            resolver = None
+            pkg_names = [module_name] if self.recursive else []
+
+        # skip the costly def-use analysis when it cannot find anything
+        if not self.needs_analysis(module, pkg_names):
+            return {}
+        duc, anc = analyze(module)
+
+        if resolver is None:
+            deprecated_imports = []
+        else:
+            resolver.process_module(module, duc, anc)
+            deprecated_imports = [make_deprecated(d, reason)
+                                  for _, _, d, reason in
+                                  resolver.get_deprecated_users(duc, anc)]
+        deprecated = self.collect_deprecated(module, duc, anc,
+                                             pkg_name=module_name)
+        deprecated.update(deprecated_imports)
+        return {symbol_name(d[0]): d[1] for d in deprecated if d is not None}
 
     def get_deprecated_users(self, defuse, ancestors):
-        deprecated_uses = []
+        with stats.timer('deprecated users'):
+            return list(self.iter_deprecated_users(defuse, ancestors))
+
+    def iter_deprecated_users(self, defuse, ancestors):
+        '''
+        Yield the uses of the deprecated identifiers as they are found, as
+        (deprecated node, user node, user ancestor, reason) tuples.
+        '''
+        # innermost definition enclosing each node visited so far, shared by
+        # all the users of the module
+        enclosing = {}
+
+        def enclosing_definition(node):
+            pending = []
+            definition = None
+            for parent in reversed(ancestors.parents(node)):
+                if isinstance(parent, _defs):
+                    definition = parent
+                    break
+                if parent in enclosing:
+                    definition = enclosing[parent]
+                    break
+                pending.append(parent)
+            for parent in pending:
+                enclosing[parent] = definition
+            return definition
+
         visited = set()
         worklist = list(self.deprecated)
         while worklist:
@@ -176,10 +598,9 @@ class ImportResolver(ast.NodeVisitor):
             visited.add(deprecated_node)
 
             # special node: an imported name
-            if isinstance(deprecated_node, ast.alias):
-                deprecated_uses.append((deprecated_node,
-                                        ancestors.parent(deprecated_node),
-                                        deprecated_node, reason))
+            if isinstance(deprecated_node, _alias):
+                yield (deprecated_node, ancestors.parent(deprecated_node),
+                       deprecated_node, reason)
 
             else:
                 # There's a special handler in ImportFrom for these
@@ -187,19 +608,12 @@ class ImportResolver(ast.NodeVisitor):
                     continue
 
                 for user in defuse.chains[deprecated_node].users():
-                    user_ancestors = [n
-                                      for n in ancestors.parents(user.node)
-                                      if isinstance(n, _defs)]
-                    if any(f in self.deprecated for f in user_ancestors):
-                        continue
-
-                    user_ancestor = user_ancestors[-1] if user_ancestors else user.node
-                    deprecated_uses.append((deprecated_node, user.node,
-                                            user_ancestor,
-                                            reason))
+                    user_ancestor = enclosing_definition(user.node)
+                    if user_ancestor is None:
+                        user_ancestor = user.node
+                    yield deprecated_node, user.node, user_ancestor, reason
                     if self.recursive and isinstance(user_ancestor, _defs):
                         worklist.append((user_ancestor, reason))
-        return deprecated_uses
 
     def visit_Import(self, node):
         for alias in node.names:
@@ -209,7 +623,7 @@ class ImportResolver(ast.NodeVisitor):
 
             for user in self.def_use_chains.chains[alias].users():
                 parent = self.ancestors.parents(user.node)[-1]
-                if isinstance(parent, ast.Attribute):
+                if isinstance(parent, _attribute):
                     if parent.attr in deprecated:
                         reason = deprecated[parent.attr]
                         self.deprecated.add(make_deprecated(parent, reason))
@@ -222,62 +636,124 @@ class ImportResolver(ast.NodeVisitor):
         if deprecated is None:
             return
 
-        aliases = [alias.name for alias in node.names]
-
-        try:
-            # if we're importing *, pick all deprecated items
-            star_alias_index = aliases.index('*')
-            star_alias = node.names[star_alias_index]
-
-            def alias_extractor(deprec):
-                return star_alias
-
-            def alias_selector(deprec, node):
-                return getattr(node, 'id', None) == deprec
-
-        except ValueError:
-            # otherwise only pick the imported one
-
-            def alias_extractor(deprec):
-                try:
-                    index = aliases.index(deprec)
-                    alias = node.names[index]
-                    return alias
-                except ValueError:
-                    return None
-
-            def alias_selector(deprec, node):
-                return True
+        # index the imported names once per statement, so that matching
+        # scales with the references rather than with the number of
+        # deprecated names of the imported module
+        star_aliases = [alias for alias in node.names if alias.name == '*']
+        if star_aliases:
+            # if we're importing *, users are selected by their name
+            users = defaultdict(list)
+            for user in self.def_use_chains.chains[star_aliases[0]].users():
+                name = getattr(user.node, 'id', None)
+                if name in deprecated:
+                    users[name].append(user)
+            matches = users.items()
+        else:
+            # otherwise only pick the imported ones, the first alias of a
+            # name being the one in use
+            imported = {}
+            for alias in node.names:
+                imported.setdefault(alias.name, alias)
+            matches = ((name, self.def_use_chains.chains[alias].users())
+                       for name, alias in imported.items()
+                       if name in deprecated)
+
+        for deprec, deprec_users in matches:
+            reason = deprecated[deprec]
+            for user in deprec_users:
+                self.deprecated.add(make_deprecated(user.node, reason))
 
-        for deprec, reason in deprecated.items():
-            deprec_alias = alias_extractor(deprec)
-            if deprec_alias is None:
+    def may_reference_deprecated(self, code):
+        '''
+        Fast textual check telling whether `code' may reference a deprecated
+        identifier: it must mention the decorator or import a module with
+        deprecated identifiers. Source text that only looks like an import
+        statement leads to extra module lookups, never to a wrong answer.
+        '''
+        if not isinstance(code, str) or self.decorator[-1] in code:
+            return True
+        # join explicit line continuations to catch split imports
+        code = code.replace('\\\n', ' ')
+        for level, module, names in _imports_re.findall(code):
+            if names:
+                imported = [(name.split()[0], 0) for name in names.split(',')]
+            elif module:
+                imported = [(module, len(level))]
+            else:
+                # `from . import x' is ignored by the analysis
                 continue
+            for module_name, module_level in imported:
+                if self.load_deprecated_from_module(module_name,
+                                                    module_level):
+                    return True
+        return False
+
+    def needs_analysis(self, module, pkg_names=()):
+        '''
+        Cheap pre-pass over the import statements of `module', telling whether
+        its def-use analysis can find deprecated identifiers, i.e. whether it
+        imports the decorator or a module with deprecated identifiers.
 
-            for user in self.def_use_chains.chains[deprec_alias].users():
-                # if deprec_alias is '*' we need to be selective
-                if not alias_selector(deprec, user.node):
+        Imported modules are only looked up if `pkg_names' is not empty,
+        relative imports being resolved from each of these packages.
+        '''
+        resolvers = [ImportResolver(self.decorator,
+                                    self.reason_keyword,
+                                    self.search_paths,
+                                    self.recursive,
+                                    self,
+                                    pkg_name)
+                     for pkg_name in pkg_names]
+        for node in iter_imports(module):
+            if isinstance(node, _import_from):
+                if node.module is None:
                     continue
-                self.deprecated.add(make_deprecated(user.node, reason))
+                prefix = tuple(node.module.split('.'))
+                for alias in node.names:
+                    path = prefix + (alias.name,)
+                    if path == self.decorator[:len(path)]:
+                        return True
+                # only relative imports depend on the importing package
+                for resolver in resolvers if node.level else resolvers[:1]:
+                    if resolver.load_deprecated_from_module(node.module,
+                                                            node.level):
+                        return True
+            else:
+                for alias in node.names:
+                    path = tuple(alias.name.split('.'))
+                    if path == self.decorator[:len(path)]:
+                        return True
+                    if resolvers and \
+                       resolvers[0].load_deprecated_from_module(alias.name):
+                        return True
+        return False
 
     def visit_Module(self, node):
-        duc = SilentDefUseChains()
-        duc.visit(node)
-        self.def_use_chains = duc
+        pkg_names = [self.pkg_name]
+        if self.recursive and self.pkg_name is not None:
+            pkg_names.append(None)
+
+        if self.needs_analysis(node, pkg_names):
+            self.process_module(node, *analyze(node))
+        else:
+            self.def_use_chains = self.ancestors = None
+            self.deprecated = set()
 
-        ancestors = beniget.Ancestors()
-        ancestors.visit(node)
+    def process_module(self, node, duc, ancestors):
+        self.def_use_chains = duc
         self.ancestors = ancestors
 
         self.deprecated = self.collect_deprecated(node, duc, ancestors)
-        self.generic_visit(node)
+        # only import statements are visited, expressions can be skipped
+        for stmt in iter_imports(node):
+            self.visit(stmt)
 
     def collect_deprecated(self, node, duc, ancestors, pkg_name=None):
         deprecated = set()
 
         for dlocal in duc.locals[node]:
             dnode = dlocal.node
-            if not isinstance(dnode, ast.alias):
+            if not isinstance(dnode, _alias):
                 continue
 
             original_path = tuple(dnode.name.split('.'))
@@ -297,7 +773,7 @@ class ImportResolver(ast.NodeVisitor):
             # original path to be fully qualified here. In the example above, it
             # becomes `foo.bar` instead of just `bar`.
             alias_parent = ancestors.parents(dnode)[-1]
-            if isinstance(alias_parent, ast.ImportFrom):
+            if isinstance(alias_parent, _import_from):
                 module = "."
                 # A module can be None if a relative import from "." occurs
                 if alias_parent.module is not None:
@@ -314,7 +790,7 @@ class ImportResolver(ast.NodeVisitor):
                     while attrs and parents:
                         attr = attrs[-1]
                         parent = parents.pop()
-                        if not isinstance(parent, (ast.Attribute)):
+                        if not isinstance(parent, _attribute):
                             break
                         if parent.attr != attr:
                             break
@@ -337,10 +813,10 @@ class ImportResolver(ast.NodeVisitor):
         # deprecated symbol.
         for dlocal in duc.locals[node]:
             dnode = dlocal.node
-            if not isinstance(dnode, ast.alias):
+            if not isinstance(dnode, _alias):
                 continue
             alias_parent = ancestors.parents(dnode)[-1]
-            if isinstance(alias_parent, ast.ImportFrom):
+            if isinstance(alias_parent, _import_from):
                 if not alias_parent.module:
                     continue
                 resolver = ImportResolver(self.decorator,
@@ -375,7 +851,7 @@ class ImportResolver(ast.NodeVisitor):
         if len(parents) == 1:
             return
         parent_p = parents[-2]
-        if isinstance(parent, ast.Call) and isinstance(parent_p, _defs):
+        if isinstance(parent, _call) and isinstance(parent_p, _defs):
             reason = None
             # Output only the specified reason with the --reason-keyword flag
             if not parent.keywords and parent.args:
@@ -389,19 +865,63 @@ class ImportResolver(ast.NodeVisitor):
 def prettyname(node):
     if isinstance(node, _defs):
         return node.name
-    if isinstance(node, ast.alias):
+    if isinstance(node, _alias):
         return node.asname or node.name
-    if isinstance(node, ast.Name):
+    if isinstance(node, _name):
         return node.id
-    if isinstance(node, ast.alias):
+    if isinstance(node, _alias):
         return node.asname or node.name
-    if isinstance(node, ast.Attribute):
+    if isinstance(node, _attribute):
         return prettyname(node.value) + '.' + node.attr
     return repr(node)
 
 
+def iter_memestra(file_descriptor, decorator, reason_keyword,
+                  search_paths=None, recursive=False, cache_dir=None,
+                  session=None):
+    '''
+    Same as `memestra`, but yield the (function, filename, line, colno,
+    reason) tuples as they are found, in no particular order, instead of
+    returning a sorted list.
+    '''
+
+    assert not isinstance(decorator, str) and \
+           len(decorator) > 1, "decorator is at least (module, attribute)"
+
+    code = file_descriptor.read()
+    stats.count('files scanned')
+
+    owns_session = session is None
+    if owns_session:
+        session = ResolverSession(recursive, cache_dir)
+
+    try:
+        resolver = ImportResolver(decorator, reason_keyword, search_paths,
+                                  recursive, session=session)
+        if not resolver.may_reference_deprecated(code):
+            session.prefiltered += 1
+            stats.count('files prefiltered')
+            return
+
+        # Collect deprecated functions
+        resolver.visit(parse(code))
+
+        # Find their users
+        filename = getattr(file_descriptor, 'name', '<>')
+        users = resolver.iter_deprecated_users(resolver.def_use_chains,
+                                               resolver.ancestors)
+        for deprecated_node, user_node, _, reason in \
+                stats.timed('deprecated users', users):
+            yield (prettyname(deprecated_node), filename, user_node.lineno,
+                   user_node.col_offset, reason)
+    finally:
+        if owns_session:
+            session.flush()
+
+
 def memestra(file_descriptor, decorator, reason_keyword,
-             search_paths=None, recursive=False, cache_dir=None):
+             search_paths=None, recursive=False, cache_dir=None,
+             session=None):
     '''
     Parse `file_descriptor` and returns a list of
     (function, filename, line, colno) tuples. Each elements
@@ -413,44 +933,339 @@ def memestra(file_descriptor, decorator, reason_keyword,
     If `recursive` is set to `True`, deprecated use are
     checked recursively throughout the *whole* module import tree. Otherwise,
     only one level of import is checked.
+
+    `session` is an optional ResolverSession, used to share import
+    resolution, module summaries and cache handles across several calls.
     '''
+    return sorted(iter_memestra(file_descriptor, decorator, reason_keyword,
+                                search_paths, recursive, cache_dir, session))
 
-    assert not isinstance(decorator, str) and \
-           len(decorator) > 1, "decorator is at least (module, attribute)"
 
-    module, syntax_errors = frilouz.parse(ast.parse, file_descriptor.read())
-    # Collect deprecated functions
-    resolver = ImportResolver(decorator, reason_keyword, search_paths,
-                              recursive, cache_dir=cache_dir)
-    resolver.visit(module)
+def load_dispatcher():
+    '''
+    Map file extensions to scanning functions, taking plugins into account.
+    Python files are scanned by `memestra'. Scanning functions are called
+    with the same arguments as `memestra', including the `session' to scan
+    within.
+    '''
+    from pkg_resources import iter_entry_points
+
+    dispatcher = defaultdict(lambda: memestra)
+    for entry_point in iter_entry_points(group='memestra.plugins', name=None):
+        entry_point.load()(dispatcher)
+    return dispatcher
+
+
+def collect_imports(path):
+    '''
+    Return the name of the modules absolutely imported by the file at `path'.
+    '''
+    with open(path, 'rb') as fd:
+        try:
+            tree = stdlib_ast.parse(fd.read())
+        except (SyntaxError, ValueError):
+            return []
+    imports = []
+    for node in stdlib_ast.walk(tree):
+        if isinstance(node, stdlib_ast.Import):
+            imports.extend(alias.name for alias in node.names)
+        elif isinstance(node, stdlib_ast.ImportFrom):
+            if node.module and not node.level:
+                imports.append(node.module)
+    return imports
+
+
+class Scanner(object):
+    '''
+    Scan files one after the other, within a single ResolverSession.
+    '''
+
+    def __init__(self, decorator, reason_keyword, recursive=False,
+                 cache_dir=None, **cache_options):
+        self.decorator = decorator
+        self.reason_keyword = reason_keyword
+        self.recursive = recursive
+        self.cache_dir = cache_dir
+        self.session = ResolverSession(recursive, cache_dir, **cache_options)
+        self.dispatcher = load_dispatcher()
+
+    @staticmethod
+    def search_paths(path):
+        # Add the directory of the python file to the list of import paths
+        # to search.
+        return [os.path.dirname(os.path.abspath(path))]
+
+    def scan(self, path):
+        _, extension = os.path.splitext(path)
+        # record the modules the file depends on
+        abspath = os.path.abspath(path)
+        self.session.dependencies[abspath] = set()
+        self.session.importers.append(abspath)
+        try:
+            with open(path) as fd:
+                return self.dispatcher[extension](fd,
+                                                  self.decorator,
+                                                  self.reason_keyword,
+                                                  self.search_paths(path),
+                                                  self.recursive,
+                                                  self.cache_dir,
+                                                  session=self.session)
+        finally:
+            self.session.importers.pop()
+
+    def summarize(self, module_name, search_paths):
+        resolver = ImportResolver(self.decorator, self.reason_keyword,
+                                  list(search_paths), self.recursive,
+                                  session=self.session)
+        resolver.load_deprecated_from_module(module_name)
+
+    def refresh(self):
+        self.session.refresh()
+
+    def flush(self):
+        self.session.flush()
+
+
+# Each worker process of a parallel scan owns a Scanner
+_worker_scanner = None
+
+
+def _init_worker(args, kwargs, collect_stats=False):
+    from multiprocessing.util import Finalize
+    global _worker_scanner
+    stats.enabled = collect_stats
+    _worker_scanner = Scanner(*args, **kwargs)
+    # flush the session when the worker exits
+    Finalize(_worker_scanner, _worker_scanner.flush, exitpriority=10)
+
+
+def _worker_stats():
+    # statistics are sent back to the parent process along with each result
+    return stats.collect() if stats.enabled else None
+
+
+def _worker_scan(path):
+    return _worker_scanner.scan(path), _worker_stats()
+
 
-    ancestors = resolver.ancestors
-    duc = resolver.def_use_chains
+def _worker_summarize(task):
+    _worker_scanner.summarize(*task)
+    return _worker_stats()
 
-    # Find their users
-    formated_deprecated = []
-    for deprecated_info in resolver.get_deprecated_users(duc, ancestors):
-        deprecated_node, user_node, _, reason = deprecated_info
-        formated_deprecated.append((prettyname(deprecated_node),
-                               getattr(file_descriptor, 'name', '<>'),
-                               user_node.lineno,
-                               user_node.col_offset,
-                               reason))
-    formated_deprecated.sort()
-    return formated_deprecated
+
+def _warm(scanner, module_name):
+    try:
+        scanner.summarize(module_name, ())
+    except Exception as e:
+        return module_name, '{}: {}'.format(type(e).__name__, e)
+    return module_name, None
+
+
+def _worker_warm(module_name):
+    return _warm(_worker_scanner, module_name)
+
+
+def cpu_count():
+    try:
+        return len(os.sched_getaffinity(0))
+    except AttributeError:
+        return os.cpu_count() or 1
+
+
+def scan_files(paths, decorator, reason_keyword, recursive=False,
+               cache_dir=None, jobs=1, **cache_options):
+    '''
+    Scan each file in `paths' and yield the list of deprecated uses found in
+    each of them, in the order of `paths'.
+
+    If `jobs' is greater than 1, files are scanned by a pool of `jobs'
+    processes that share the on-disk cache. In recursive mode, the modules
+    imported by the scanned files are first summarized by the pool. If `jobs'
+    is 0, one process per CPU is used.
+
+    The automatic garbage collection policy of the cache, if any, is applied
+    once the scan is over.
+
+    When statistics are enabled, those of the worker processes are merged
+    into the statistics of the current process.
+
+    `cache_options' are forwarded to the ResolverSession constructor.
+    '''
+    import time
+
+    started = time.time()
+    if jobs == 0:
+        jobs = cpu_count()
+    jobs = min(jobs, len(paths))
+
+    scanner_args = decorator, reason_keyword, recursive, cache_dir
+
+    if jobs <= 1:
+        scanner = Scanner(*scanner_args, **cache_options)
+        for path in paths:
+            yield scanner.scan(path)
+        scanner.flush()
+        scanner.session.cache.auto_gc(started)
+        return
+
+    import multiprocessing
+
+    with multiprocessing.Pool(jobs, _init_worker,
+                              (scanner_args, cache_options,
+                               stats.enabled)) as pool:
+        if recursive:
+            tasks = []
+            seen = set()
+            for path in paths:
+                search_paths = tuple(Scanner.search_paths(path))
+                for module_name in collect_imports(path):
+                    task = module_name, search_paths
+                    if task not in seen:
+                        seen.add(task)
+                        tasks.append(task)
+            for worker_stats in pool.imap_unordered(_worker_summarize, tasks):
+                if worker_stats is not None:
+                    stats.merge(worker_stats)
+
+        for deprecate_uses, worker_stats in pool.imap(_worker_scan, paths):
+            if worker_stats is not None:
+                stats.merge(worker_stats)
+            yield deprecate_uses
+
+        # let the workers exit gracefully, so that they flush their session
+        pool.close()
+        pool.join()
+
+    # workers have recorded the entries they used, which are kept
+    Cache(cache_dir, backend=cache_options.get('backend')).auto_gc(started)
+
+
+def warm_cache(module_names, decorator, reason_keyword, recursive=False,
+               cache_dir=None, jobs=1, **cache_options):
+    '''
+    Compute the summary of each module in `module_names', as found from
+    `sys.path', and store it in the cache, using `jobs' processes as
+    `scan_files' does.
+
+    Yield the name of each module once it's processed, along with an error
+    message if its summary could not be computed, None otherwise. Modules are
+    processed in no particular order.
+    '''
+    if jobs == 0:
+        jobs = cpu_count()
+
+    scanner_args = decorator, reason_keyword, recursive, cache_dir
+
+    if jobs <= 1:
+        scanner = Scanner(*scanner_args, **cache_options)
+        try:
+            for module_name in module_names:
+                yield _warm(scanner, module_name)
+        finally:
+            scanner.flush()
+        return
+
+    import multiprocessing
+
+    with multiprocessing.Pool(jobs, _init_worker,
+                              (scanner_args, cache_options)) as pool:
+        for result in pool.imap_unordered(_worker_warm, module_names):
+            yield result
+
+        # let the workers exit gracefully, so that they flush their session
+        pool.close()
+        pool.join()
+
+
+def _fingerprint(path):
+    try:
+        stat = os.stat(path)
+    except OSError:
+        return None
+    return stat.st_size, stat.st_mtime_ns, stat.st_ino
+
+
+def watch_files(inputs, extensions, decorator, reason_keyword,
+                recursive=False, cache_dir=None, interval=1, **cache_options):
+    '''
+    Scan the files designated by `inputs', as `expand_inputs' understands
+    them, then poll these files and the modules they depend on every
+    `interval' seconds. Whenever some of them change, only the files affected
+    by the change are scanned again.
+
+    Yield the path and the list of deprecated uses of each scanned file, and
+    never return.
+
+    `cache_options' are forwarded to the ResolverSession constructor.
+    '''
+    import time
+
+    started = time.time()
+    scanner = Scanner(decorator, reason_keyword, recursive, cache_dir,
+                      **cache_options)
+    session = scanner.session
+    fingerprints = {}
+    try:
+        while True:
+            paths = {}
+            for input_ in inputs:
+                try:
+                    for path in expand_inputs([input_], extensions):
+                        paths.setdefault(os.path.abspath(path), path)
+                except ValueError:
+                    # removed in the meantime
+                    pass
+
+            watched = set(paths).union(fingerprints)
+            for path, deps in session.dependency_graph().items():
+                watched.update(deps)
+
+            changed = set()
+            for path in watched:
+                fingerprint = _fingerprint(path)
+                if fingerprint != fingerprints.get(path):
+                    changed.add(path)
+                if fingerprint is None:
+                    fingerprints.pop(path, None)
+                else:
+                    fingerprints[path] = fingerprint
+
+            if changed:
+                stale = session.invalidate(changed)
+                for abspath, path in paths.items():
+                    if abspath in stale:
+                        yield path, scanner.scan(path)
+                scanner.flush()
+                session.cache.auto_gc(started)
+
+                # modules discovered by the scan are watched from now on
+                for deps in session.dependency_graph().values():
+                    for dep in deps.difference(fingerprints):
+                        fingerprint = _fingerprint(dep)
+                        if fingerprint is not None:
+                            fingerprints[dep] = fingerprint
+
+            time.sleep(interval)
+    finally:
+        scanner.flush()
 
 
 def run():
 
     import argparse
-    from pkg_resources import iter_entry_points
 
-    parser = argparse.ArgumentParser(description='Check decorator usage.')
+    if sys.argv[1:2] == ['serve']:
+        from memestra.daemon import run as run_daemon
+        return run_daemon(sys.argv[2:])
+
+    parser = argparse.ArgumentParser(description='Check decorator usage.',
+                                     fromfile_prefix_chars='@')
     parser.add_argument('--decorator', dest='decorator',
                         default='deprecated.deprecated',
                         help='Path to the decorator to check')
-    parser.add_argument('input', type=argparse.FileType('r'),
-                        help='file to scan')
+    parser.add_argument('input', nargs='+',
+                        help='files, directories or glob patterns to scan, '
+                             'or @file to read them from a file')
     parser.add_argument('--reason-keyword', dest='reason_keyword',
                         default='reason',
                         action='store',
@@ -459,35 +1274,163 @@ def run():
                         default=None,
                         action='store',
                         help='The directory where the cache is located')
+    parser.add_argument('--cache-backend', dest='cache_backend',
+                        default=None, choices=sorted(cache_backends),
+                        help='The storage backend of the cache')
+    parser.add_argument('--cache-memory-size', dest='cache_memory_size',
+                        default=None, type=int,
+                        help='Number of cache entries kept in memory')
+    parser.add_argument('--strict-hashing', dest='strict_hashing',
+                        action='store_true',
+                        help='Always hash modules to compute their cache key, '
+                             'even if their stat fingerprint did not change')
     parser.add_argument('--recursive', dest='recursive',
                         action='store_true',
                         help='Traverse the whole module hierarchy')
-
-    dispatcher = defaultdict(lambda: memestra)
-    for entry_point in iter_entry_points(group='memestra.plugins', name=None):
-        entry_point.load()(dispatcher)
+    parser.add_argument('--early-cutoff', dest='early_cutoff',
+                        action='store_true',
+                        help='In recursive mode, only analyze again the '
+                             'modules whose imported modules changed their '
+                             'deprecated identifiers')
+    parser.add_argument('-j', '--jobs', dest='jobs',
+                        default=1, type=int,
+                        help='Number of files scanned in parallel, '
+                             '0 means one per CPU')
+    parser.add_argument('--changed', dest='changed',
+                        action='append', default=[],
+                        help='Only scan the inputs affected by a change to '
+                             'this file, or never scanned before; '
+                             'can be repeated')
+    parser.add_argument('--watch', dest='watch',
+                        action='store_true',
+                        help='Keep running, and scan again the files '
+                             'affected by each change')
+    parser.add_argument('--watch-interval', dest='watch_interval',
+                        default=1, type=float,
+                        help='Delay between two checks for changes, '
+                             'in seconds')
+    parser.add_argument('--daemon', dest='daemon',
+                        action='store_true',
+                        help='Scan through the daemon started by '
+                             '`memestra serve`, if it is running')
+    parser.add_argument('--socket', dest='socket',
+                        default=None,
+                        help='Path to the Unix socket of the daemon')
+    parser.add_argument('--stats', dest='stats',
+                        action='store_true',
+                        help='Report the time spent in each phase of the '
+                             'scan and various counters on the standard '
+                             'error')
+    parser.add_argument('--stats-format', dest='stats_format',
+                        default='table', choices=('table', 'json'),
+                        help='Format of the statistics report')
 
     args = parser.parse_args()
 
-    _, extension = os.path.splitext(args.input.name)
-
-    # Add the directory of the python file to the list of import paths
-    # to search.
-    search_paths = [os.path.dirname(os.path.abspath(args.input.name))]
-
-    deprecate_uses = dispatcher[extension](args.input,
-                                           args.decorator.split('.'),
-                                           args.reason_keyword,
-                                           search_paths,
-                                           args.recursive,
-                                           args.cache_dir)
-
-    for fname, fd, lineno, colno, reason in deprecate_uses:
-        formatted_reason = ""
-        if reason:
-            formatted_reason = " - {}".format(reason)
-        print("{} used at {}:{}:{}{}".format(fname, fd, lineno, colno + 1, formatted_reason))
-
+    if args.stats:
+        stats.enabled = True
+
+    if args.jobs < 0:
+        parser.error('--jobs must be positive')
+
+    extensions = None
+    if args.daemon:
+        from memestra.daemon import default_socket_path, remote_extensions
+        socket_path = args.socket or default_socket_path()
+        # plugins are already loaded by the daemon
+        extensions = remote_extensions(socket_path)
+    if extensions is None:
+        extensions = {'.py'}.union(load_dispatcher())
+    try:
+        inputs = expand_inputs(args.input, extensions)
+    except ValueError as e:
+        parser.error(str(e))
+
+    if args.changed:
+        cache = Cache(cache_dir=args.cache_dir, backend=args.cache_backend)
+        graph = DependencyGraph(cache.metadata_path('dependencies.json'))
+        affected = graph.affected(os.path.abspath(path)
+                                  for path in args.changed)
+        inputs = [path for path in inputs
+                  if os.path.abspath(path) in affected or
+                  os.path.abspath(path) not in graph.dependencies]
+
+    decorator = args.decorator.split('.')
+    cache_options = {'backend': args.cache_backend,
+                     'memory_size': args.cache_memory_size,
+                     'strict_hashing': args.strict_hashing,
+                     'early_cutoff': args.early_cutoff}
+
+    def report(deprecate_uses):
+        for fname, fd, lineno, colno, reason in deprecate_uses:
+            formatted_reason = ""
+            if reason:
+                formatted_reason = " - {}".format(reason)
+            print("{} used at {}:{}:{}{}".format(fname, fd, lineno,
+                                                 colno + 1,
+                                                 formatted_reason))
+
+    def report_stats():
+        if not args.stats:
+            return
+        if args.stats_format == 'json':
+            print(stats.format_json(), file=sys.stderr)
+        else:
+            print(stats.format_table(), file=sys.stderr)
+
+    if args.watch:
+        updates = watch_files(args.input,
+                              extensions,
+                              decorator,
+                              args.reason_keyword,
+                              args.recursive,
+                              args.cache_dir,
+                              args.watch_interval,
+                              **cache_options)
+        scanned = set()
+        try:
+            for path, deprecate_uses in updates:
+                # tell that the previous findings of a file are gone
+                if path in scanned and not deprecate_uses:
+                    print("no deprecated use in {}".format(path))
+                scanned.add(path)
+                report(deprecate_uses)
+                sys.stdout.flush()
+        except KeyboardInterrupt:
+            pass
+        report_stats()
+        return
+
+    with stats.timer('total'):
+        all_deprecate_uses = None
+        if args.daemon:
+            from memestra.daemon import scan_files_remote
+            all_deprecate_uses = scan_files_remote(
+                socket_path,
+                inputs,
+                decorator,
+                args.reason_keyword,
+                args.recursive,
+                args.cache_dir,
+                **cache_options)
+
+        if all_deprecate_uses is None:
+            # All the files share the same session (per process), so that
+            # module resolution, module summaries and cache handles are
+            # computed only once.
+            all_deprecate_uses = scan_files(inputs,
+                                            decorator,
+                                            args.reason_keyword,
+                                            args.recursive,
+                                            args.cache_dir,
+                                            args.jobs,
+                                            **cache_options)
+
+        # report each file as soon as it's scanned
+        for deprecate_uses in all_deprecate_uses:
+            report(deprecate_uses)
+            sys.stdout.flush()
+    report_stats()
 
 if __name__ == '__main__':
     run()
@@ -5,7 +5,8 @@ import nbformat
 import os
 
 
-def nbmemestra_from_nbnode(nb, decorator, search_paths=None, reason_keyword='reason'):
+def _iter_nbnode_uses(nb, decorator, search_paths, reason_keyword,
+                      recursive=False, cache_dir=None, session=None):
     # Get code cells
     cells = nb.cells
     code_cells = [c for c in cells if c['cell_type'] == 'code']
@@ -24,17 +25,18 @@ def nbmemestra_from_nbnode(nb, decorator, search_paths=None, reason_keyword='rea
 
     # Collect calls to deprecated functions
     deprecated_list = memestra(StringIO(code), decorator, reason_keyword,
-                               search_paths)
+                               search_paths, recursive, cache_dir, session)
 
     # Map them to cells
-    result = []
     for d in deprecated_list:
         cell = next(x for x in cell_list if x.begin <= d[2] and d[2] < x.end)
-        result.append((d[0],
-                       'Cell[' + str(cell.id) + ']', d[2] - cell.begin + 1,
-                       d[3]))
+        yield (d[0], 'Cell[' + str(cell.id) + ']', d[2] - cell.begin + 1,
+               d[3], d[4])
+
 
-    return result
+def nbmemestra_from_nbnode(nb, decorator, search_paths=None, reason_keyword='reason'):
+    return [use[:4] for use in _iter_nbnode_uses(nb, decorator, search_paths,
+                                                 reason_keyword)]
 
 
 def nbmemestra(nbfile, decorator, reason_keyword='reason'):
@@ -43,5 +45,19 @@ def nbmemestra(nbfile, decorator, reason_keyword='reason'):
                                   [os.path.dirname(nbfile)], reason_keyword)
 
 
+def scan(file_descriptor, decorator, reason_keyword, search_paths=None,
+         recursive=False, cache_dir=None, session=None):
+    '''
+    Scanning function of the notebook plugin, with the same signature and
+    result as `memestra.memestra'. Uses are located as `path:Cell[id]'.
+    '''
+    nb = nbformat.read(file_descriptor, 4)
+    nbfile = getattr(file_descriptor, 'name', '<>')
+    return [(name, '{}:{}'.format(nbfile, cell), lineno, colno, reason)
+            for name, cell, lineno, colno, reason
+            in _iter_nbnode_uses(nb, decorator, search_paths, reason_keyword,
+                                 recursive, cache_dir, session)]
+
+
 def register(dispatcher):
-    dispatcher['.ipynb'] = nbmemestra
+    dispatcher['.ipynb'] = scan
@@ -0,0 +1,133 @@
+import json
+import time
+
+
+class _Timer(object):
+
+    __slots__ = 'timers', 'name', 'start'
+
+    def __init__(self, timers, name):
+        self.timers = timers
+        self.name = name
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+
+    def __exit__(self, *exc_info):
+        elapsed = time.perf_counter() - self.start
+        timer = self.timers.setdefault(self.name, [0, 0.])
+        timer[0] += 1
+        timer[1] += elapsed
+
+
+class _NullTimer(object):
+
+    __slots__ = ()
+
+    def __enter__(self):
+        pass
+
+    def __exit__(self, *exc_info):
+        pass
+
+
+_null_timer = _NullTimer()
+
+
+class Stats(object):
+    '''
+    Cumulative timers and counters describing where a scan spends its time.
+
+    Nothing is recorded unless `enabled' is set, so that instrumented code
+    only pays for a test when statistics are not wanted.
+    '''
+
+    def __init__(self):
+        self.enabled = False
+        self.clear()
+
+    def clear(self):
+        # name -> [number of calls, seconds]
+        self.timers = {}
+        self.counters = {}
+
+    def timer(self, name):
+        '''
+        Context manager accumulating the time spent in its body under `name'.
+        '''
+        if not self.enabled:
+            return _null_timer
+        return _Timer(self.timers, name)
+
+    def timed(self, name, iterable):
+        '''
+        Iterate over `iterable', accumulating the time spent computing its
+        items under `name', as a single call.
+        '''
+        if not self.enabled:
+            yield from iterable
+            return
+        iterator = iter(iterable)
+        elapsed = 0.
+        try:
+            while True:
+                start = time.perf_counter()
+                try:
+                    item = next(iterator)
+                except StopIteration:
+                    return
+                finally:
+                    elapsed += time.perf_counter() - start
+                yield item
+        finally:
+            timer = self.timers.setdefault(name, [0, 0.])
+            timer[0] += 1
+            timer[1] += elapsed
+
+    def count(self, name, value=1):
+        if self.enabled:
+            self.counters[name] = self.counters.get(name, 0) + value
+
+    def as_dict(self):
+        return {'timers': {name: {'calls': calls, 'seconds': seconds}
+                           for name, (calls, seconds) in self.timers.items()},
+                'counters': dict(self.counters)}
+
+    def collect(self):
+        '''
+        Return the statistics recorded so far, as `as_dict' does, and start
+        over.
+        '''
+        data = self.as_dict()
+        self.clear()
+        return data
+
+    def merge(self, data):
+        '''
+        Add the statistics `data', as returned by `as_dict', to the current
+        ones, e.g. to gather the statistics of several processes.
+        '''
+        for name, timer in data['timers'].items():
+            current = self.timers.setdefault(name, [0, 0.])
+            current[0] += timer['calls']
+            current[1] += timer['seconds']
+        for name, value in data['counters'].items():
+            self.counters[name] = self.counters.get(name, 0) + value
+
+    def format_table(self):
+        lines = ['{:<24} {:>8} {:>12}'.format('phase', 'calls', 'seconds')]
+        for name, (calls, seconds) in sorted(self.timers.items()):
+            lines.append('{:<24} {:>8} {:>12.4f}'.format(name, calls,
+                                                         seconds))
+        lines.append('')
+        lines.append('{:<24} {:>8}'.format('counter', 'value'))
+        for name, value in sorted(self.counters.items()):
+            lines.append('{:<24} {:>8}'.format(name, value))
+        return '\n'.join(lines)
+
+    def format_json(self):
+        return json.dumps(self.as_dict(), indent=2, sort_keys=True)
+
+
+# Statistics of the current process
+stats = Stats()
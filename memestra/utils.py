@@ -1,9 +1,239 @@
+import ast
+import gast
+import frilouz
+import glob
+import hashlib
+import json
 import os
 import sys
+import tempfile
+import time
 from importlib import util
 from importlib.abc import SourceLoader
 
+from memestra.stats import stats
+
+class ResolutionCache(object):
+    '''
+    Per-process memoization of module resolution, keyed by module name and
+    additional search paths. Failed resolutions are remembered too.
+
+    The cache is flushed whenever `sys.path' changes.
+    '''
+
+    def __init__(self):
+        self.entries = {}
+        self.sys_path = list(sys.path)
+        self.hits = 0
+        self.misses = 0
+
+    def clear(self):
+        self.entries.clear()
+        self.sys_path = list(sys.path)
+        self.hits = self.misses = 0
+
+    def lookup(self, key):
+        if self.sys_path != sys.path:
+            self.entries.clear()
+            self.sys_path = list(sys.path)
+            if module_index is not None:
+                module_index.reload()
+        try:
+            result = self.entries[key]
+        except KeyError:
+            self.misses += 1
+            return None
+        self.hits += 1
+        stats.count('resolution cache hits')
+        return result
+
+resolution_cache = ResolutionCache()
+
+def _abspath(path):
+    return os.path.abspath(path or '.')
+
+def _dir_stamp(path):
+    try:
+        return os.stat(path).st_mtime_ns
+    except OSError:
+        return None
+
+# Files modified that recently may still change within the same timestamp
+RACY_DELAY = 2 * 10 ** 9
+
+def is_racy(mtime_ns):
+    '''
+    Tell whether a file or directory with modification time `mtime_ns' may
+    change without its modification time changing.
+    '''
+    now = int(time.time() * 10 ** 9)
+    return mtime_ns is not None and mtime_ns > now - RACY_DELAY
+
+def load_json(path, version):
+    '''
+    Load the JSON document stored at `path', and return its 'data' field if
+    its 'version' field matches `version', None otherwise.
+    '''
+    try:
+        with open(path) as fd:
+            document = json.load(fd)
+    except (OSError, ValueError):
+        return None
+    if not isinstance(document, dict) or document.get('version') != version:
+        return None
+    return document.get('data')
+
+def dump_json(path, version, data):
+    '''
+    Atomically store `data' at `path', in a format understood by `load_json'.
+    '''
+    tmp_fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path) or '.',
+                                        prefix='.')
+    with os.fdopen(tmp_fd, 'w') as fd:
+        json.dump({'version': version, 'data': data}, fd)
+    os.replace(tmp_path, path)
+
+class ModuleIndex(object):
+    '''
+    Persistent mapping from module name and search paths to module location,
+    stored as a JSON file, with one section per Python environment.
+
+    An entry remains valid as long as the directories it was looked up in
+    keep the same modification time. The `sys.path' entries are checked once
+    when the index is loaded, other directories are checked once per process
+    or until the index is reloaded.
+    '''
+
+    version = 1
+
+    def __init__(self, path):
+        self.path = path
+        self.stamps = {}
+        self.updates = {}
+        self.hits = 0
+        self.misses = 0
+        self.load()
+
+    @staticmethod
+    def normalized_sys_path():
+        # relative entries, such as '' for the working directory, must not
+        # match another directory from one process to the other
+        return [_abspath(path) for path in sys.path]
+
+    @staticmethod
+    def environment_key():
+        env = '\0'.join([sys.executable, sys.version] +
+                         ModuleIndex.normalized_sys_path())
+        return hashlib.sha256(env.encode('utf-8', 'surrogateescape')).hexdigest()
+
+    def stamp(self, path):
+        path = _abspath(path)
+        if path not in self.stamps:
+            self.stamps[path] = _dir_stamp(path)
+        return self.stamps[path]
+
+    def _read(self):
+        return load_json(self.path, ModuleIndex.version) or {}
+
+    def load(self):
+        self.environment = self.environment_key()
+        self.sys_path = [[path, self.stamp(path)]
+                         for path in self.normalized_sys_path()]
+        environment = self._read().get(self.environment, {})
+        if environment.get('sys_path') == self.sys_path:
+            self.modules = environment['modules']
+        else:
+            self.modules = {}
+
+    def reload(self):
+        # the index may outlive the cache directory it's stored in
+        try:
+            self.save()
+        except OSError:
+            self.updates.clear()
+        self.stamps.clear()
+        self.load()
+
+    @staticmethod
+    def _key(module_name, search_paths):
+        return os.pathsep.join([module_name] +
+                               [_abspath(path) for path in search_paths or ()])
+
+    def lookup(self, module_name, search_paths):
+        entry = self.modules.get(self._key(module_name, search_paths))
+        if entry is not None:
+            origin, locations, dirs = entry
+            if all(self.stamp(path) == stamp for path, stamp in dirs):
+                self.hits += 1
+                stats.count('module index hits')
+                return origin, locations
+        self.misses += 1
+        stats.count('module index misses')
+        return None
+
+    def store(self, module_name, search_paths, result, dirs):
+        origin, locations = result
+        if locations is not None:
+            locations = list(locations)
+        stamps = [[_abspath(path), self.stamp(path)] for path in dirs]
+        # don't persist entries depending on a directory that may still change
+        if any(is_racy(stamp) for _, stamp in stamps):
+            return
+        key = self._key(module_name, search_paths)
+        self.modules[key] = self.updates[key] = [origin, locations, stamps]
+
+    def save(self):
+        if not self.updates:
+            return
+        # Other processes may have updated the index in the meantime
+        environments = self._read()
+        environment = environments.get(self.environment)
+        if not environment or environment['sys_path'] != self.sys_path:
+            environment = {'sys_path': self.sys_path, 'modules': {}}
+        environment['modules'].update(self.updates)
+        environments[self.environment] = environment
+        dump_json(self.path, ModuleIndex.version, environments)
+        self.updates.clear()
+
+module_index = None
+
+def use_module_index(path):
+    '''
+    Make `resolve_module' consult the module index stored at `path', and
+    return it. Passing None disables the index.
+    '''
+    global module_index
+    if path is None:
+        module_index = None
+    elif module_index is None or module_index.path != path:
+        module_index = ModuleIndex(path)
+    return module_index
+
 def _resolve_module(module_name, additional_search_paths=None):
+    key = module_name, tuple(additional_search_paths or ())
+    result = resolution_cache.lookup(key)
+    if result is not None:
+        return result
+
+    if module_index is not None and module_name is not None:
+        result = module_index.lookup(module_name, additional_search_paths)
+
+    if result is None:
+        result = _find_module(module_name, additional_search_paths)
+        if module_index is not None and module_name is not None:
+            # a dotted module is looked up in the locations of its parents
+            dirs = list(additional_search_paths or ())
+            parent = module_name.rpartition('.')[0]
+            while parent:
+                dirs.extend(_resolve_module(parent)[1] or ())
+                parent = parent.rpartition('.')[0]
+            module_index.store(module_name, additional_search_paths, result,
+                               dirs)
+
+    resolution_cache.entries[key] = result
+    return result
+
+def _find_module(module_name, additional_search_paths=None):
     if additional_search_paths is None:
         additional_search_paths = []
 
@@ -41,4 +271,160 @@ def _resolve_module(module_name, additional_search_paths=None):
         return None, []
 
 def resolve_module(module_name, additional_search_paths=None):
-    return _resolve_module(module_name, additional_search_paths)[0]
+    stats.count('resolution lookups')
+    with stats.timer('resolve'):
+        return _resolve_module(module_name, additional_search_paths)[0]
+
+class SourceStore(object):
+    '''
+    Per-run store of module sources, so that each module is read, decoded and
+    parsed at most once, whether it's for cache key computation or analysis.
+
+    Sources are kept in memory until they are released, once the module they
+    belong to has been summarized.
+    '''
+
+    class Source(object):
+
+        def __init__(self, content):
+            self.content = content
+            self._text = self._tree = self._gast_tree = None
+
+        @property
+        def text(self):
+            if self._text is None:
+                self._text = util.decode_source(self.content)
+            return self._text
+
+        @property
+        def tree(self):
+            '''
+            Standard library AST of the module, parsing is resilient to syntax
+            errors.
+            '''
+            if self._tree is None:
+                stats.count('modules parsed')
+                with stats.timer('parse'):
+                    self._tree, _ = frilouz.parse(ast.parse, self.text)
+            return self._tree
+
+        @property
+        def gast_tree(self):
+            if self._gast_tree is None:
+                tree = self.tree
+                with stats.timer('convert'):
+                    self._gast_tree = gast.ast_to_gast(tree)
+                # The standard tree is only needed until conversion
+                self._tree = None
+            return self._gast_tree
+
+    def __init__(self):
+        self.sources = {}
+        self.reads = 0
+
+    def __getitem__(self, module_path):
+        source = self.sources.get(module_path)
+        if source is None:
+            with stats.timer('read'):
+                with open(module_path, 'rb') as fd:
+                    source = SourceStore.Source(fd.read())
+            self.reads += 1
+            stats.count('modules read')
+            stats.count('bytes read', len(source.content))
+            self.sources[module_path] = source
+        return source
+
+    def release(self, module_path):
+        '''
+        Notify that `module_path' is no longer needed.
+        '''
+        self.sources.pop(module_path, None)
+
+def _has_magic(path):
+    return any(c in path for c in '*?[')
+
+def _iter_directory(directory, extensions):
+    for root, dirs, files in os.walk(directory):
+        dirs.sort()
+        for fname in sorted(files):
+            if os.path.splitext(fname)[1] in extensions:
+                yield os.path.join(root, fname)
+
+def expand_inputs(inputs, extensions):
+    '''
+    Turn a list of files, directories and glob patterns into a list of files.
+    Directories are traversed recursively, looking for files with one of the
+    given `extensions'. Order of `inputs' is preserved, and each file is only
+    listed once.
+
+    Raise a ValueError if an input does not match any file.
+    '''
+    seen = set()
+    expanded = []
+    for path in inputs:
+        if os.path.isdir(path):
+            candidates = _iter_directory(path, extensions)
+        elif os.path.exists(path):
+            candidates = [path]
+        elif _has_magic(path):
+            candidates = []
+            for match in sorted(glob.glob(path, recursive=True)):
+                if os.path.isdir(match):
+                    candidates.extend(_iter_directory(match, extensions))
+                else:
+                    candidates.append(match)
+            if not candidates:
+                raise ValueError("no file matching '{}'".format(path))
+        else:
+            raise ValueError("can't open '{}'".format(path))
+
+        for candidate in candidates:
+            if candidate not in seen:
+                seen.add(candidate)
+                expanded.append(candidate)
+    return expanded
+
+def _iter_package(directory, prefix):
+    try:
+        names = sorted(os.listdir(directory))
+    except OSError:
+        return
+    for name in names:
+        path = os.path.join(directory, name)
+        if name.endswith('.py'):
+            module_name = name[:-3]
+            if module_name.isidentifier() and module_name != '__init__':
+                yield prefix + module_name
+        elif name.isidentifier() and \
+                os.path.isfile(os.path.join(path, '__init__.py')):
+            yield prefix + name
+            for module_name in _iter_package(path, prefix + name + '.'):
+                yield module_name
+
+def iter_modules(packages=None):
+    '''
+    Yield the name of the source modules that can be imported from
+    `sys.path', without importing them. If `packages' is given, only yield
+    these packages or modules, and their submodules.
+
+    Raise a ValueError if one of `packages' cannot be found.
+    '''
+    seen = set()
+    if packages is None:
+        candidates = (module_name
+                      for path in sys.path
+                      for module_name in _iter_package(path or '.', ''))
+    else:
+        candidates = []
+        for package in packages:
+            module_path = resolve_module(package)
+            if module_path is None:
+                raise ValueError("can't find module '{}'".format(package))
+            candidates.append(package)
+            if os.path.basename(module_path) == '__init__.py':
+                candidates.extend(_iter_package(os.path.dirname(module_path),
+                                                package + '.'))
+    for module_name in candidates:
+        if module_name not in seen:
+            seen.add(module_name)
+            yield module_name
@@ -0,0 +1,50 @@
+import os
+import shutil
+import tempfile
+from unittest import TestCase
+
+from memestra import utils
+
+# Module `a' uses the function of module `b' deprecated by `dec.deprecated'
+SOURCES = {'a': 'import b\nb.bar()',
+           'b': 'import dec\n@dec.deprecated\ndef bar(): pass',
+           'dec': 'def deprecated(f): return f'}
+
+# Modules `a' and `b' import each other
+CYCLE_SOURCES = {'a': 'import dec\nimport b\n'
+                      '@dec.deprecated\ndef fa(): pass\n'
+                      'def ga(): return b.gb()',
+                 'b': 'import dec\nimport a\n'
+                      '@dec.deprecated\ndef fb(): pass\n'
+                      'def gb(): return a.fa()\n'
+                      'def hb(): return fb()'}
+
+
+class ModulesTestCase(TestCase):
+    '''
+    Test case scanning modules written in the temporary directory
+    `self.tmpdir'.
+    '''
+
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        # sessions make the process-wide module index point to their cache
+        utils.use_module_index(None)
+        utils.resolution_cache.clear()
+        shutil.rmtree(self.tmpdir)
+
+    def write_module(self, name, source, directory=None):
+        path = os.path.join(directory or self.tmpdir, name + '.py')
+        with open(path, 'w') as fd:
+            fd.write(source)
+        return path
+
+    def write_modules(self, directory=None, **sources):
+        '''
+        Write the modules of SOURCES, replaced or completed by `sources', a
+        mapping from module names to their content.
+        '''
+        for name, source in dict(SOURCES, **sources).items():
+            self.write_module(name, source, directory)
@@ -1,8 +1,10 @@
-from unittest import TestCase
+from unittest import TestCase, mock, skipUnless
 from textwrap import dedent
 from io import StringIO
 import memestra
 
+from memestra.memestra import HAS_STDLIB_ENGINE
+
 class TestBasic(TestCase):
 
     def checkDeprecatedUses(self, code, expected_output, decorator=('decoratortest', 'deprecated')):
@@ -248,3 +250,44 @@ class TestClassBasic(TestCase):
             [('bar', '<>', 11, 0, 'ignored'),
             ('foo', '<>', 9, 4, None),
             ('foo', '<>', 11, 4, None)])
+
+
+class TestStdlibEngine(TestCase):
+
+    code = '''
+        import decoratortest
+
+        @decoratortest.deprecated
+        def foo(): pass
+
+        @decoratortest.deprecated(reason='old')
+        class bar: pass
+
+        def foobar():
+            foo()
+            return bar()
+
+        foo()'''
+
+    def checkDeprecatedUses(self, use_stdlib_ast):
+        with mock.patch('memestra.memestra.HAS_STDLIB_ENGINE',
+                        use_stdlib_ast):
+            sio = StringIO(dedent(self.code))
+            return memestra.memestra(sio, ('decoratortest', 'deprecated'),
+                                     'reason')
+
+    def test_gast_fallback(self):
+        from memestra.memestra import parse
+        import gast
+        self.assertIsInstance(parse('pass', use_stdlib_ast=False),
+                              gast.Module)
+        self.assertEqual(self.checkDeprecatedUses(False),
+                         [('bar', '<>', 12, 11, 'old'),
+                          ('foo', '<>', 11, 4, None),
+                          ('foo', '<>', 14, 0, None)])
+
+    @skipUnless(HAS_STDLIB_ENGINE,
+                'requires beniget support for standard library trees')
+    def test_stdlib_engine(self):
+        self.assertEqual(self.checkDeprecatedUses(True),
+                         self.checkDeprecatedUses(False))
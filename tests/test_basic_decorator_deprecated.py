@@ -1,10 +1,12 @@
 from unittest import TestCase, mock
 from textwrap import dedent
 import tempfile
+import shutil
 import contextlib
 from io import StringIO
 
 import memestra
+from helpers import CYCLE_SOURCES, ModulesTestCase
 
 import os
 import sys
@@ -59,8 +61,28 @@ class TestBasic(TestCase):
             code,
             [('foo', '<>', 8, 0, 'another reason')])
 
+    def test_iter_memestra(self):
+        code = '''
+            import deprecated
+
+            @deprecated.deprecated(reason='use another function')
+            def foo(): pass
+
+            foo()
+            foo()'''
 
-class TestCLI(TestCase):
+        uses = memestra.iter_memestra(StringIO(dedent(code)),
+                                      ('deprecated', 'deprecated'), 'reason',
+                                      search_paths=TESTS_PATHS)
+        first = next(uses)
+        self.assertIn(first, [('foo', '<>', 7, 0, 'use another function'),
+                              ('foo', '<>', 8, 0, 'use another function')])
+        self.assertEqual(sorted([first] + list(uses)),
+                         [('foo', '<>', 7, 0, 'use another function'),
+                          ('foo', '<>', 8, 0, 'use another function')])
+
+
+class TestCLI(ModulesTestCase):
 
     def test_default_kwarg(self):
         fid, tmppy = tempfile.mkstemp(suffix='.py')
@@ -82,3 +104,147 @@ class TestCLI(TestCase):
                 with contextlib.redirect_stdout(buf):
                     run()
                 self.assertEqual(buf.getvalue(), ref)
+
+    def test_directory(self):
+        tmpdir = tempfile.mkdtemp()
+        code = '''
+            import deprecated
+
+            @deprecated.deprecated(reason='use another function')
+            def foo(): pass
+
+            foo()'''
+
+        paths = []
+        for name in ('a.py', os.path.join('sub', 'b.py')):
+            path = os.path.join(tmpdir, name)
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            with open(path, 'w') as fd:
+                fd.write(dedent(code))
+            paths.append(path)
+        with open(os.path.join(tmpdir, 'notes.txt'), 'w') as fd:
+            fd.write('foo()')
+
+        ref = ''.join('foo used at {}:7:1 - use another function\n'
+                      .format(path) for path in paths)
+        try:
+            for inputs in ([tmpdir],
+                           paths,
+                           [os.path.join(tmpdir, '**', '*.py')]):
+                test_args = ['memestra'] + inputs
+                with mock.patch.object(sys, 'argv', test_args):
+                    from memestra.memestra import run
+                    with StringIO() as buf:
+                        with contextlib.redirect_stdout(buf):
+                            run()
+                        self.assertEqual(buf.getvalue(), ref)
+        finally:
+            shutil.rmtree(tmpdir)
+
+    def test_jobs(self):
+        tmpdir = tempfile.mkdtemp()
+        code = '''
+            import deprecated
+
+            @deprecated.deprecated(reason='use another function')
+            def foo{}(): pass
+
+            foo{}()'''
+
+        for i in range(5):
+            with open(os.path.join(tmpdir, 'm{}.py'.format(i)), 'w') as fd:
+                fd.write(dedent(code.format(i, i)))
+
+        try:
+            outputs = []
+            for jobs in ('1', '3'):
+                test_args = ['memestra', '--recursive', '--jobs', jobs, tmpdir]
+                with mock.patch.object(sys, 'argv', test_args):
+                    from memestra.memestra import run
+                    with StringIO() as buf:
+                        with contextlib.redirect_stdout(buf):
+                            run()
+                        outputs.append(buf.getvalue())
+            self.assertEqual(outputs[0], outputs[1])
+            self.assertEqual(len(outputs[0].splitlines()), 5)
+        finally:
+            shutil.rmtree(tmpdir)
+
+    def test_jobs_cycle(self):
+        modules_dir = os.path.join(self.tmpdir, 'modules')
+        os.makedirs(modules_dir)
+        self.write_modules(modules_dir, **CYCLE_SOURCES)
+        clients = ['import a\na.ga()',
+                   'import b\nb.gb()\nb.hb()',
+                   'from b import *\ngb()\nhb()',
+                   'import a, b\nb.hb()\na.ga()']
+        for i, client in enumerate(clients):
+            self.write_module('client{}'.format(i), client)
+
+        def run_main(jobs, cache_dir):
+            test_args = ['memestra', '--recursive', '--jobs', jobs,
+                         '--decorator', 'dec.deprecated',
+                         '--cache-dir', cache_dir,
+                         self.tmpdir + os.sep + '*.py']
+            with mock.patch.object(sys, 'argv', test_args):
+                from memestra.memestra import run
+                with StringIO() as buf:
+                    with contextlib.redirect_stdout(buf):
+                        run()
+                    return buf.getvalue()
+
+        with mock.patch.object(sys, 'path', [modules_dir] + sys.path):
+            ref = run_main('1', os.path.join(self.tmpdir, 'cache1'))
+            self.assertIn('a.ga used at', ref)
+            self.assertIn('gb used at', ref)
+            self.assertEqual(len(ref.splitlines()), 7)
+            cache_dir = os.path.join(self.tmpdir, 'cache3')
+            # cold, then warm
+            for _ in range(2):
+                self.assertEqual(run_main('3', cache_dir), ref)
+
+    def test_watch(self):
+        path = os.path.join('src', 'a.py')
+        use = ('foo', path, 7, 0, 'use another function')
+        updates = [(path, [use]), (path, [use]), (path, [])]
+        test_args = ['memestra', '--watch', TESTS_PATHS[0]]
+        with mock.patch.object(sys, 'argv', test_args), \
+                mock.patch('memestra.memestra.watch_files',
+                           return_value=iter(updates)):
+            from memestra.memestra import run
+            with StringIO() as buf:
+                with contextlib.redirect_stdout(buf):
+                    run()
+                found = 'foo used at {}:7:1 - use another function\n'.format(
+                    path)
+                self.assertEqual(buf.getvalue(),
+                                 found * 2 +
+                                 'no deprecated use in {}\n'.format(path))
+
+    def test_changed(self):
+        cache_dir = os.path.join(self.tmpdir, 'cache')
+        self.write_modules(c='import dec\n@dec.deprecated\ndef foo(): pass\n'
+                             'foo()')
+
+        def run_main(main, *args):
+            with mock.patch.object(sys, 'argv', list(args)):
+                with StringIO() as buf:
+                    with contextlib.redirect_stdout(buf):
+                        main()
+                    return buf.getvalue().splitlines()
+
+        from memestra.memestra import run
+        from memestra.caching import run as run_cache
+        common_args = ['memestra', '--cache-dir', cache_dir,
+                       '--decorator', 'dec.deprecated']
+        a_path = os.path.join(self.tmpdir, 'a.py')
+        b_path = os.path.join(self.tmpdir, 'b.py')
+        self.assertEqual(len(run_main(run, *common_args + [self.tmpdir])), 2)
+        self.assertEqual(run_main(run_cache, 'memestra-cache',
+                                  '--cache-dir', cache_dir,
+                                  'affected', b_path),
+                         [a_path, b_path])
+        self.assertEqual(run_main(run, *common_args + ['--changed',
+                                                       b_path,
+                                                       self.tmpdir]),
+                         ['b.bar used at {}:2:1'.format(a_path)])
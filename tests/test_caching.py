@@ -70,6 +70,290 @@ class TestCaching(TestCase):
         finally:
             shutil.rmtree(tmpdir)
 
+    def test_memory(self):
+        tmpdir = tempfile.mkdtemp()
+        try:
+            cache = memestra.caching.Cache(cache_dir=tmpdir, memory_size=1)
+            key_factory = memestra.caching.CacheKeyFactory()
+            key0 = key_factory(__file__)
+            key1 = key_factory(memestra.caching.__file__)
+            cache[key0] = {}
+            cache[key1] = {}
+            self.assertEqual(cache.evictions, 1)
+            self.assertIn(key1, cache)
+            self.assertEqual((cache.hits, cache.misses), (1, 0))
+            self.assertIn(key0, cache)
+            self.assertEqual((cache.hits, cache.misses), (1, 1))
+            self.assertEqual(cache.evictions, 2)
+            self.assertIsNone(cache.get(key_factory(shutil.__file__)))
+            self.assertEqual((cache.hits, cache.misses), (1, 2))
+        finally:
+            shutil.rmtree(tmpdir)
+
+    def test_stat_index(self):
+        tmpdir = tempfile.mkdtemp()
+        try:
+            module_path = os.path.join(tmpdir, 'module.py')
+            index_path = os.path.join(tmpdir, 'fingerprints.json')
+            with open(module_path, 'w') as fd:
+                fd.write('def foo(): pass')
+            # pretend the file is old enough to be indexed
+            os.utime(module_path, (0, 0))
+
+            strict_key = memestra.caching.CacheKeyFactory()(module_path)
+            for hits in (0, 1):
+                stat_index = memestra.caching.StatIndex(index_path)
+                key_factory = memestra.caching.CacheKeyFactory(stat_index)
+                key = key_factory(module_path)
+                stat_index.save()
+                self.assertEqual(stat_index.hits, hits)
+                self.assertEqual(key.module_hash, strict_key.module_hash)
+
+            with open(module_path, 'w') as fd:
+                fd.write('def foobar(): pass')
+            os.utime(module_path, (0, 0))
+            stat_index = memestra.caching.StatIndex(index_path)
+            key = memestra.caching.CacheKeyFactory(stat_index)(module_path)
+            self.assertEqual(stat_index.hits, 0)
+            self.assertNotEqual(key.module_hash, strict_key.module_hash)
+        finally:
+            shutil.rmtree(tmpdir)
+
+    def test_early_cutoff_key(self):
+        tmpdir = tempfile.mkdtemp()
+        try:
+            module_path = os.path.join(tmpdir, 'module.py')
+            dep_path = os.path.join(tmpdir, 'dep.py')
+            with open(module_path, 'w') as fd:
+                fd.write('import dep')
+            with open(dep_path, 'w') as fd:
+                fd.write('def foo(): pass')
+
+            summaries = {dep_path: {'foo': None}}
+
+            def summarize(path, key):
+                return summaries.get(path)
+
+            def make_key(summarize):
+                factory = memestra.caching.RecursiveCacheKeyFactory(
+                    summarize=summarize)
+                return factory(module_path).module_hash
+
+            with mock.patch.object(sys, 'path', [tmpdir] + sys.path):
+                key = make_key(summarize)
+                self.assertNotEqual(key, make_key(None))
+
+                # the summary of the dependency did not change
+                with open(dep_path, 'w') as fd:
+                    fd.write('def foo():\n    pass')
+                self.assertEqual(key, make_key(summarize))
+
+                summaries[dep_path] = {'foo': 'why'}
+                self.assertNotEqual(key, make_key(summarize))
+        finally:
+            shutil.rmtree(tmpdir)
+
+    def test_import_index(self):
+        tmpdir = tempfile.mkdtemp()
+        try:
+            module_path = os.path.join(tmpdir, 'module.py')
+            dep_path = os.path.join(tmpdir, 'dep.py')
+            with open(module_path, 'w') as fd:
+                fd.write('import dep')
+            with open(dep_path, 'w') as fd:
+                fd.write('def foo(): pass')
+            # pretend the files are old enough to be indexed
+            for path in (module_path, dep_path):
+                os.utime(path, (0, 0))
+
+            stat_path = os.path.join(tmpdir, 'fingerprints.json')
+            index_path = os.path.join(tmpdir, 'imports.json')
+            with mock.patch.object(sys, 'path', [tmpdir] + sys.path):
+                strict_key = memestra.caching.RecursiveCacheKeyFactory()(
+                    module_path)
+                for hits, reads in ((0, 2), (2, 0)):
+                    stat_index = memestra.caching.StatIndex(stat_path)
+                    import_index = memestra.caching.ImportIndex(index_path)
+                    key_factory = memestra.caching.RecursiveCacheKeyFactory(
+                        stat_index, import_index=import_index)
+                    key = key_factory(module_path)
+                    stat_index.save()
+                    import_index.save()
+                    self.assertEqual(import_index.hits, hits)
+                    self.assertEqual(key_factory.sources.reads, reads)
+                    self.assertEqual(key.module_hash, strict_key.module_hash)
+                    self.assertEqual(key.dependencies, {dep_path})
+        finally:
+            shutil.rmtree(tmpdir)
+
+    def test_dependency_graph(self):
+        tmpdir = tempfile.mkdtemp()
+        try:
+            graph_path = os.path.join(tmpdir, 'dependencies.json')
+            graph = memestra.caching.DependencyGraph(graph_path)
+            graph.update({'/a.py': {'/b.py'}, '/b.py': {'/c.py'},
+                          '/d.py': {'/c.py'}})
+            self.assertEqual(graph.affected(['/b.py']), {'/a.py', '/b.py'})
+            graph.save()
+
+            graph = memestra.caching.DependencyGraph(graph_path)
+            self.assertEqual(graph.affected(['/c.py']),
+                             {'/a.py', '/b.py', '/c.py', '/d.py'})
+            graph.update({'/b.py': set()})
+            self.assertEqual(graph.affected(['/c.py']), {'/c.py', '/d.py'})
+        finally:
+            shutil.rmtree(tmpdir)
+
+    def test_gc(self):
+        import time
+        for backend in sorted(memestra.caching.backends):
+            tmpdir = tempfile.mkdtemp()
+            try:
+                keys = []
+                cache_dir = os.path.join(tmpdir, 'cache')
+                cache = memestra.caching.Cache(cache_dir=cache_dir,
+                                               backend=backend)
+                for i in range(3):
+                    module_path = os.path.join(tmpdir, 'm{}.py'.format(i))
+                    with open(module_path, 'w') as fd:
+                        fd.write('x = {}'.format(i))
+                    key = memestra.caching.CacheKeyFactory()(module_path)
+                    cache[key] = {'deprecated': []}
+                    keys.append(key)
+                    # make sure entries are ordered by last use
+                    time.sleep(.02)
+
+                self.assertEqual(cache.gc(max_entries=2), 1)
+                self.assertEqual(len(cache.keys()), 2)
+
+                # reading an entry makes it the most recently used
+                started = time.time()
+                cache = memestra.caching.Cache(cache_dir=cache_dir,
+                                               backend=backend)
+                self.assertIsNotNone(cache.get(keys[1]))
+                self.assertEqual(cache.gc(max_entries=1), 1)
+                self.assertEqual(cache.keys(), [keys[1].module_hash])
+
+                # entries used since the beginning of the run are kept
+                self.assertEqual(cache.gc(max_age=0, since=started), 0)
+                self.assertEqual(cache.gc(max_age=0), 1)
+            finally:
+                shutil.rmtree(tmpdir)
+
+    def test_gc_memory_hits(self):
+        import time
+        for backend in sorted(memestra.caching.backends):
+            tmpdir = tempfile.mkdtemp()
+            try:
+                cache = memestra.caching.Cache(cache_dir=tmpdir,
+                                               backend=backend)
+                key = memestra.caching.CacheKeyFactory()(__file__)
+                cache[key] = {'deprecated': []}
+
+                # a first request reads the entry
+                self.assertIsNotNone(cache.get(key))
+                cache.flush()
+                # pretend the entry has not been used for a long time
+                if backend == 'yaml':
+                    os.utime(os.path.join(tmpdir, key.module_hash), (0, 0))
+                else:
+                    cache.backend.db.execute('UPDATE entries SET atime = 0')
+
+                # a second one reads it from memory
+                started = time.time()
+                self.assertIsNotNone(cache.get(key))
+                self.assertEqual(cache.hits, 2)
+                cache.flush()
+                self.assertEqual(cache.gc(max_age=0, since=started), 0)
+            finally:
+                shutil.rmtree(tmpdir)
+
+    def test_shared_cache_index(self):
+        tmpdir = tempfile.mkdtemp()
+        try:
+            shared_dir = os.path.join(tmpdir, 'share')
+            index_path = os.path.join(tmpdir, 'shared.json')
+            os.makedirs(os.path.join(shared_dir, 'pkg'))
+            entries = {'__init__.yml': "deprecated: ['foo']",
+                       'mod.yml': "deprecated: ['bar:why']"}
+            for name, entry in entries.items():
+                with open(os.path.join(shared_dir, 'pkg', name), 'w') as fd:
+                    fd.write(entry)
+            # pretend the files are old enough to be indexed
+            for path in (shared_dir, os.path.join(shared_dir, 'pkg'),
+                         os.path.join(shared_dir, 'pkg', '__init__.yml'),
+                         os.path.join(shared_dir, 'pkg', 'mod.yml')):
+                os.utime(path, (0, 0))
+
+            shared_cache = memestra.caching.SharedCache(shared_dir,
+                                                        index_path)
+            self.assertTrue(os.path.isfile(index_path))
+
+            # the index is reused, with the entry content
+            with mock.patch.object(memestra.caching.SharedCache, '_build',
+                                   side_effect=AssertionError):
+                shared_cache = memestra.caching.SharedCache(shared_dir,
+                                                            index_path)
+                with mock.patch('memestra.caching.open',
+                                side_effect=AssertionError, create=True):
+                    self.assertEqual(shared_cache['pkg'],
+                                     {'deprecated': ['foo']})
+                    self.assertEqual(shared_cache.get('pkg/mod'),
+                                     {'deprecated': ['bar:why']})
+
+            # entries edited in place are loaded again
+            mod_path = os.path.join(shared_dir, 'pkg', 'mod.yml')
+            with open(mod_path, 'w') as fd:
+                fd.write("deprecated: ['bar:why', 'baz']")
+            os.utime(mod_path, (1, 1))
+            os.utime(os.path.join(shared_dir, 'pkg'), (0, 0))
+            with mock.patch.object(memestra.caching.SharedCache, '_build',
+                                   side_effect=AssertionError):
+                shared_cache = memestra.caching.SharedCache(shared_dir,
+                                                            index_path)
+                self.assertEqual(shared_cache.get('pkg/mod'),
+                                 {'deprecated': ['bar:why', 'baz']})
+
+            # and rebuilt when the directory changes
+            with open(os.path.join(shared_dir, 'pkg', 'new.yml'), 'w') as fd:
+                fd.write("deprecated: []")
+            shared_cache = memestra.caching.SharedCache(shared_dir,
+                                                        index_path)
+            self.assertIn('pkg/new', shared_cache)
+        finally:
+            shutil.rmtree(tmpdir)
+
+    def test_load_shared_cache(self):
+        self.assertIs(memestra.caching.load_shared_cache(),
+                      memestra.caching.load_shared_cache())
+
+    def test_sqlite_backend(self):
+        tmpdir = tempfile.mkdtemp()
+        try:
+            cache = memestra.caching.Cache(cache_dir=tmpdir, backend='sqlite')
+            key = memestra.caching.CacheKeyFactory()(__file__)
+            self.assertNotIn(key, cache)
+            cache[key] = {'deprecated': ['foo']}
+            self.assertIn(key, cache)
+            self.assertEqual(cache[key]['deprecated'], ['foo'])
+            self.assertEqual(cache[key]['name'], 'test_caching')
+            self.assertEqual(list(cache.keys()), [key.module_hash])
+            # no file per entry
+            self.assertTrue(all(name.startswith('.')
+                                for name in os.listdir(tmpdir)))
+            self.assertEqual(cache.clear(), 1)
+            self.assertNotIn(key, cache)
+        finally:
+            shutil.rmtree(tmpdir)
+
+    def test_invalid_backend(self):
+        tmpdir = tempfile.mkdtemp()
+        try:
+            with self.assertRaises(ValueError):
+                memestra.caching.Cache(cache_dir=tmpdir, backend='unknown')
+        finally:
+            shutil.rmtree(tmpdir)
+
 class TestCLI(TestCase):
 
     def test_docparse(self):
@@ -156,3 +440,118 @@ class TestCLI(TestCase):
             os.remove(tmppy.name)
             shutil.rmtree(tmpdir)
 
+
+    def test_migrate(self):
+        tmpdir = tempfile.mkdtemp()
+        try:
+            yaml_cache = memestra.caching.Cache(cache_dir=tmpdir)
+            key = memestra.caching.CacheKeyFactory()(__file__)
+            yaml_cache[key] = {'deprecated': ['foo']}
+            migrate_args = ['memestra-cache',
+                            '--cache-dir=' + tmpdir,
+                            'migrate', 'sqlite']
+            with mock.patch.object(sys, 'argv', migrate_args):
+                from memestra.caching import run
+                with StringIO() as buf:
+                    with contextlib.redirect_stdout(buf):
+                        run()
+                    self.assertEqual(buf.getvalue(),
+                                     'Cache migrated, 1 element moved.\n')
+
+            self.assertNotIn(key, memestra.caching.Cache(cache_dir=tmpdir,
+                                                         backend='yaml'))
+            sqlite_cache = memestra.caching.Cache(cache_dir=tmpdir,
+                                                  backend='sqlite')
+            self.assertEqual(sqlite_cache[key]['deprecated'], ['foo'])
+
+            # the migrated cache is used by default
+            cache = memestra.caching.Cache(cache_dir=tmpdir)
+            self.assertIsInstance(cache.backend,
+                                  memestra.caching.SqliteBackend)
+            self.assertEqual(cache[key]['deprecated'], ['foo'])
+        finally:
+            shutil.rmtree(tmpdir)
+
+    def test_migrate_same_backend(self):
+        tmpdir = tempfile.mkdtemp()
+        try:
+            cache = memestra.caching.Cache(cache_dir=tmpdir)
+            key = memestra.caching.CacheKeyFactory()(__file__)
+            cache[key] = {'deprecated': ['foo']}
+            migrate_args = ['memestra-cache',
+                            '--cache-dir=' + tmpdir,
+                            'migrate', 'yaml']
+            with mock.patch.object(sys, 'argv', migrate_args):
+                from memestra.caching import run
+                with StringIO() as buf:
+                    with contextlib.redirect_stderr(buf):
+                        with self.assertRaises(SystemExit):
+                            run()
+
+            cache = memestra.caching.Cache(cache_dir=tmpdir)
+            self.assertEqual(cache[key]['deprecated'], ['foo'])
+        finally:
+            shutil.rmtree(tmpdir)
+
+    def test_gc(self):
+        tmpdir = tempfile.mkdtemp()
+        try:
+            cache_dir = os.path.join(tmpdir, 'cache')
+            cache = memestra.caching.Cache(cache_dir=cache_dir)
+            for i in range(3):
+                module_path = os.path.join(tmpdir, 'm{}.py'.format(i))
+                with open(module_path, 'w') as fd:
+                    fd.write('x = {}'.format(i))
+                key = memestra.caching.CacheKeyFactory()(module_path)
+                cache[key] = {'deprecated': []}
+
+            gc_args = ['memestra-cache', '--cache-dir=' + cache_dir,
+                       'gc', '--max-entries', '1', '--auto']
+            with mock.patch.object(sys, 'argv', gc_args):
+                from memestra.caching import run
+                with StringIO() as buf:
+                    with contextlib.redirect_stdout(buf):
+                        run()
+                    self.assertEqual(buf.getvalue(),
+                                     'Cache collected, 2 elements removed.\n')
+            self.assertEqual(len(cache.keys()), 1)
+
+            # the policy has just been applied
+            self.assertEqual(cache.auto_gc(None), 0)
+            with mock.patch.object(memestra.caching.Cache, 'gc_interval', 0):
+                self.assertEqual(cache.auto_gc(None), 0)
+                self.assertEqual(cache.gc(max_entries=0), 1)
+        finally:
+            shutil.rmtree(tmpdir)
+
+    def test_parse_limits(self):
+        from memestra.caching import parse_duration, parse_size
+        self.assertEqual(parse_size('512'), 512)
+        self.assertEqual(parse_size('2M'), 2 * 2 ** 20)
+        self.assertEqual(parse_duration('90'), 90)
+        self.assertEqual(parse_duration('7d'), 7 * 86400)
+
+    def test_warm(self):
+        tmpdir = tempfile.mkdtemp()
+        try:
+            outputs = []
+            for options in (['-j', '2'], ['--resume']):
+                warm_args = ['memestra-cache', '--cache-dir=' + tmpdir,
+                             'warm'] + options + ['json']
+                with mock.patch.object(sys, 'argv', warm_args):
+                    from memestra.caching import run
+                    with StringIO() as buf:
+                        with contextlib.redirect_stdout(buf):
+                            run()
+                        outputs.append(buf.getvalue())
+
+            nb_modules = len(list(memestra.utils.iter_modules(['json'])))
+            self.assertEqual(outputs,
+                             ['Cache warmed, {} modules summarized, 0 '
+                              'failed.\n'.format(nb_modules),
+                              'Cache warmed, 0 module summarized, 0 '
+                              'failed.\n'])
+            cache = memestra.caching.Cache(cache_dir=tmpdir)
+            self.assertEqual(len(cache.keys()), nb_modules)
+        finally:
+            shutil.rmtree(tmpdir)
@@ -0,0 +1,64 @@
+from unittest import mock
+
+import os
+import threading
+
+from helpers import ModulesTestCase
+from memestra.daemon import Server, remote_extensions, scan_files_remote
+from memestra.daemon import send
+
+
+class TestDaemon(ModulesTestCase):
+
+    def setUp(self):
+        super(TestDaemon, self).setUp()
+        self.socket_path = os.path.join(self.tmpdir, 'memestra.sock')
+        self.cache_dir = os.path.join(self.tmpdir, 'cache')
+        self.write_modules()
+
+    def scan(self):
+        return scan_files_remote(self.socket_path,
+                                 [os.path.join(self.tmpdir, 'a.py')],
+                                 ('dec', 'deprecated'), None,
+                                 cache_dir=self.cache_dir)
+
+    def test_no_daemon(self):
+        self.assertIsNone(self.scan())
+
+    def test_serve(self):
+        server = Server(self.socket_path)
+        thread = threading.Thread(target=server.serve_forever)
+        thread.start()
+        try:
+            a_path = os.path.join(self.tmpdir, 'a.py')
+            self.assertEqual(self.scan(), [[('b.bar', a_path, 2, 0, None)]])
+            self.assertEqual(len(server.scanners), 1)
+
+            # changes are taken into account by the next request
+            with open(os.path.join(self.tmpdir, 'b.py'), 'w') as fd:
+                fd.write('def bar(): pass')
+            self.assertEqual(self.scan(), [[]])
+            self.assertEqual(len(server.scanners), 1)
+
+            self.assertEqual(send(self.socket_path, {'command': 'shutdown'}),
+                             {})
+            thread.join()
+        finally:
+            server.shutdown()
+            server.server_close()
+
+    def test_foreign_socket(self):
+        server = Server(self.socket_path)
+        thread = threading.Thread(target=server.serve_forever)
+        thread.start()
+        try:
+            self.assertIn('.py', remote_extensions(self.socket_path))
+            # pretend the socket belongs to another user
+            with mock.patch('memestra.daemon.os.getuid',
+                            return_value=os.getuid() + 1):
+                self.assertIsNone(remote_extensions(self.socket_path))
+                self.assertIsNone(self.scan())
+        finally:
+            server.shutdown()
+            server.server_close()
+            thread.join()
@@ -2,6 +2,7 @@ from unittest import TestCase, mock
 from textwrap import dedent
 from io import StringIO
 import memestra
+from helpers import CYCLE_SOURCES, SOURCES, ModulesTestCase
 
 import os
 import sys
@@ -75,6 +76,22 @@ class TestImports(TestCase):
             code,
             [('Module.foo', '<>', 5, 4, None), ('Module.foo', '<>', 8, 0, None)])
 
+    def test_nested_import(self):
+        code = '''
+            try:
+                from some_module import foo
+            except ImportError:
+                pass
+            def bar():
+                from some_module import foobar
+                foobar()
+            foo()'''
+
+        self.checkDeprecatedUses(
+            code,
+            [('foo', '<>', 9, 0, None),
+             ('foobar', '<>', 8, 4, "because it's too old")])
+
 class TestRecImports(TestCase):
 
     def checkDeprecatedUses(self, code, expected_output):
@@ -183,6 +200,20 @@ class TestRecImports(TestCase):
             code,
             [('Test', '<>', 3, 4, None)])
 
+    def test_import_star_several_deprecated(self):
+        code = '''
+            from some_module import *
+            foobar()
+            bar()
+            foo()
+            foobar()'''
+
+        self.checkDeprecatedUses(
+            code,
+            [('foo', '<>', 5, 0, None),
+             ('foobar', '<>', 3, 0, "because it's too old"),
+             ('foobar', '<>', 6, 0, "because it's too old")])
+
     def test_importing_non_existing_file(self):
         code = '''
             from phantom import void, empty
@@ -195,7 +226,7 @@ class TestRecImports(TestCase):
              ('empty', '<>', 4, 0, None)])
 
 
-class TestImportPkg(TestCase):
+class TestImportPkg(ModulesTestCase):
 
     def checkDeprecatedUses(self, code, expected_output):
         sio = StringIO(dedent(code))
@@ -245,6 +276,175 @@ class TestImportPkg(TestCase):
             code,
             [('foo', '<>', 4, 4, 'why')])
 
+    def test_session(self):
+        from memestra.memestra import ResolverSession
+        session = ResolverSession(recursive=True)
+        codes = ['from pkg.sub.other import other\nother()',
+                 'from ipy import *\nb = foo()']
+        for code in codes:
+            expected = memestra.memestra(StringIO(code),
+                                         ('decoratortest', 'deprecated'),
+                                         None, search_paths=TESTS_PATHS,
+                                         recursive=True)
+            output = memestra.memestra(StringIO(code),
+                                       ('decoratortest', 'deprecated'),
+                                       None, search_paths=TESTS_PATHS,
+                                       recursive=True, session=session)
+            self.assertEqual(output, expected)
+        self.assertTrue(session.summaries)
+
+    def test_single_read(self):
+        from memestra.memestra import ResolverSession
+        self.write_modules(a='import b\ndef foo(): return b.bar()')
+        session = ResolverSession(recursive=True, cache_dir=self.tmpdir)
+        output = memestra.memestra(StringIO('import a\na.foo()'),
+                                   ('dec', 'deprecated'), None,
+                                   search_paths=[self.tmpdir], recursive=True,
+                                   session=session)
+        self.assertEqual(output, [('a.foo', '<>', 2, 0, None)])
+        self.assertEqual(session.sources.reads, 3)
+
+    def test_single_read_large(self):
+        from memestra.memestra import ResolverSession
+        size = 100
+        sources = {'dec': SOURCES['dec'],
+                   'm{}'.format(size): 'import dec\n'
+                                       '@dec.deprecated\ndef foo(): pass'}
+        for i in range(size):
+            sources['m{}'.format(i)] = ('import m{0}\n'
+                                        'def foo(): m{0}.foo()'.format(i + 1))
+        for name, source in sources.items():
+            self.write_module(name, source)
+        with mock.patch.object(sys, 'path', [self.tmpdir] + sys.path):
+            session = ResolverSession(recursive=True, cache_dir=self.tmpdir)
+            output = memestra.memestra(StringIO('import m0\nm0.foo()'),
+                                       ('dec', 'deprecated'), None,
+                                       search_paths=[self.tmpdir],
+                                       recursive=True, session=session)
+        self.assertEqual(output, [('m0.foo', '<>', 2, 0, None)])
+        # sources are kept from key computation to analysis
+        self.assertEqual(session.sources.reads, len(sources))
+        self.assertEqual(session.sources.sources, {})
+
+    def test_early_cutoff(self):
+        from memestra.memestra import ImportResolver, ResolverSession
+        self.write_modules(a='import b\ndef foo(): return b.bar()')
+
+        def scan():
+            session = ResolverSession(recursive=True, cache_dir=self.tmpdir,
+                                      early_cutoff=True)
+            summarize = ImportResolver.summarize_module
+            with mock.patch.object(ImportResolver, 'summarize_module',
+                                   autospec=True,
+                                   side_effect=summarize) as summarizer:
+                output = memestra.memestra(StringIO('import a\na.foo()'),
+                                           ('dec', 'deprecated'), None,
+                                           search_paths=[self.tmpdir],
+                                           recursive=True,
+                                           session=session)
+            session.flush()
+            self.assertEqual(output, [('a.foo', '<>', 2, 0, None)])
+            return summarizer.call_count
+
+        with mock.patch.object(sys, 'path', [self.tmpdir] + sys.path):
+            self.assertEqual(scan(), 3)
+            self.assertEqual(scan(), 0)
+
+            # the summary of dec doesn't change, so a and b are not
+            # summarized again
+            with open(os.path.join(self.tmpdir, 'dec.py'), 'a') as fd:
+                fd.write('\n# some comment')
+            self.assertEqual(scan(), 1)
+
+    def test_early_cutoff_cycle(self):
+        from memestra.memestra import ResolverSession
+        self.write_modules(**CYCLE_SOURCES)
+
+        def scan(early_cutoff):
+            cache_dir = os.path.join(self.tmpdir,
+                                     'cache{}'.format(early_cutoff))
+            session = ResolverSession(recursive=True, cache_dir=cache_dir,
+                                      early_cutoff=early_cutoff)
+            output = memestra.memestra(StringIO('import a, b\n'
+                                                'b.hb()\na.ga()'),
+                                       ('dec', 'deprecated'), None,
+                                       search_paths=[self.tmpdir],
+                                       recursive=True,
+                                       session=session)
+            session.flush()
+            return output
+
+        with mock.patch.object(sys, 'path', [self.tmpdir] + sys.path):
+            ref = scan(False)
+            self.assertEqual(ref, [('a.ga', '<>', 3, 0, None),
+                                   ('b.hb', '<>', 2, 0, None)])
+            # cold, then warm
+            for _ in range(2):
+                self.assertEqual(scan(True), ref)
+
+            # the key of a depends on the content of b
+            self.write_module('b', CYCLE_SOURCES['b'].replace('a.fa()',
+                                                              'None'))
+            self.assertEqual(scan(True), [('b.hb', '<>', 2, 0, None)])
+
+    def test_lazy_analysis(self):
+        from memestra.memestra import ResolverSession, analyze
+        self.write_module('plain', 'import os\ndef foo(): pass')
+        self.write_module('b', SOURCES['b'])
+        session = ResolverSession(cache_dir=self.tmpdir)
+        with mock.patch('memestra.memestra.analyze',
+                        wraps=analyze) as analyzer:
+            output = memestra.memestra(StringIO('import plain\n'
+                                                'plain.foo()'),
+                                       ('dec', 'deprecated'), None,
+                                       search_paths=[self.tmpdir],
+                                       session=session)
+            self.assertEqual(output, [])
+            self.assertEqual(analyzer.call_count, 0)
+
+            output = memestra.memestra(StringIO('import b\nb.bar()'),
+                                       ('dec', 'deprecated'), None,
+                                       search_paths=[self.tmpdir],
+                                       session=session)
+            self.assertEqual(output, [('b.bar', '<>', 2, 0, None)])
+            self.assertEqual(analyzer.call_count, 2)
+        self.assertEqual(session.prefiltered, 1)
+
+        output = memestra.memestra(StringIO('from b import (\n'
+                                            '    bar)\n'
+                                            'bar()'),
+                                   ('dec', 'deprecated'), None,
+                                   search_paths=[self.tmpdir],
+                                   session=session)
+        self.assertEqual(output, [('bar', '<>', 3, 0, None)])
+        self.assertEqual(session.prefiltered, 1)
+
+    def test_watch(self):
+        from memestra.memestra import watch_files
+        self.write_modules(c='x = 1')
+
+        def path(name):
+            return os.path.join(self.tmpdir, name + '.py')
+
+        updates = watch_files([self.tmpdir], {'.py'}, ('dec', 'deprecated'),
+                              None, recursive=True,
+                              cache_dir=os.path.join(self.tmpdir, 'cache'),
+                              interval=.01)
+        scanned = dict(next(updates) for _ in range(4))
+        self.assertEqual(scanned[path('a')],
+                         [('b.bar', path('a'), 2, 0, None)])
+
+        # only the modified file and the files depending on it are
+        # scanned again
+        self.write_module('b', 'def bar(): pass\n')
+        scanned = dict(next(updates) for _ in range(2))
+        self.assertEqual(scanned, {path('a'): [], path('b'): []})
+
+        self.write_module('c', 'x = 1')
+        os.utime(path('c'), ns=(0, 0))
+        self.assertEqual(next(updates), (path('c'), []))
+        updates.close()
+
     def test_shared_cache(self):
         # We have a fake description for gast in tests/share/memestra
         # Setup the shared cache to use it.
@@ -1,5 +1,9 @@
 import os
-from unittest import TestCase
+import contextlib
+import shutil
+import tempfile
+from io import StringIO
+from unittest import TestCase, mock
 from memestra import nbmemestra, preprocessor
 import nbformat
 from traitlets.config import Config
@@ -22,6 +26,41 @@ class NotebookTest(TestCase):
                            ('some_module.foo', 'Cell[2]', 2, 4)]
         self.assertEqual(output, expected_output)
 
+    def test_directory_scan(self):
+        tmpdir = tempfile.mkdtemp()
+        nbfile = os.path.join(tmpdir, 'demo.ipynb')
+        shutil.copy(TESTS_NB_FILE, nbfile)
+        test_args = ['memestra', '--decorator', 'decoratortest.deprecated',
+                     tmpdir]
+        try:
+            with mock.patch.object(sys, 'argv', test_args):
+                from memestra.memestra import run
+                with StringIO() as buf:
+                    with contextlib.redirect_stdout(buf):
+                        run()
+                    output = buf.getvalue()
+        finally:
+            shutil.rmtree(tmpdir)
+        ref = ''.join('some_module.foo used at {}:{}\n'.format(nbfile, loc)
+                      for loc in ('Cell[0]:2:1', 'Cell[0]:3:1',
+                                  'Cell[2]:2:5'))
+        self.assertEqual(output, ref)
+
+    def test_scanner_session(self):
+        from memestra.memestra import Scanner
+        tmpdir = tempfile.mkdtemp()
+        try:
+            scanner = Scanner(('decoratortest', 'deprecated'), 'reason',
+                              cache_dir=tmpdir)
+            output = scanner.scan(TESTS_NB_FILE)
+            self.assertEqual(len(output), 3)
+            # the notebook is scanned within the session of the scanner
+            self.assertEqual(
+                scanner.session.dependencies[TESTS_NB_FILE],
+                {os.path.join(this_dir, 'misc', 'some_module.py')})
+        finally:
+            shutil.rmtree(tmpdir)
+
     def test_nbconvert_demo(self):
         self.maxDiff = None
         with open(TESTS_NB_FILE) as f:
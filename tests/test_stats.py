@@ -0,0 +1,92 @@
+from unittest import TestCase, mock
+from io import StringIO
+
+import contextlib
+import json
+import os
+import sys
+
+from helpers import ModulesTestCase
+from memestra.stats import Stats, stats
+
+
+class TestStats(TestCase):
+
+    def test_disabled(self):
+        recorder = Stats()
+        with recorder.timer('parse'):
+            recorder.count('modules parsed')
+        self.assertEqual(recorder.as_dict(), {'timers': {}, 'counters': {}})
+
+    def test_enabled(self):
+        recorder = Stats()
+        recorder.enabled = True
+        for _ in range(2):
+            with recorder.timer('parse'):
+                recorder.count('modules parsed')
+        recorder.count('bytes read', 10)
+
+        data = recorder.as_dict()
+        self.assertEqual(data['timers']['parse']['calls'], 2)
+        self.assertGreaterEqual(data['timers']['parse']['seconds'], 0)
+        self.assertEqual(data['counters'],
+                         {'modules parsed': 2, 'bytes read': 10})
+
+        other = Stats()
+        other.merge(recorder.collect())
+        other.merge(data)
+        self.assertEqual(recorder.as_dict(), {'timers': {}, 'counters': {}})
+        self.assertEqual(other.timers['parse'][0], 4)
+        self.assertEqual(other.counters['bytes read'], 20)
+
+    def test_timed(self):
+        recorder = Stats()
+        self.assertEqual(list(recorder.timed('users', range(3))), [0, 1, 2])
+        self.assertEqual(recorder.timers, {})
+
+        recorder.enabled = True
+        self.assertEqual(list(recorder.timed('users', range(3))), [0, 1, 2])
+        # stopping the iteration early still records the call
+        for _ in recorder.timed('users', range(3)):
+            break
+        self.assertEqual(recorder.timers['users'][0], 2)
+
+
+class TestCLI(ModulesTestCase):
+
+    def setUp(self):
+        super(TestCLI, self).setUp()
+        self.write_modules()
+
+    def tearDown(self):
+        stats.enabled = False
+        stats.clear()
+        super(TestCLI, self).tearDown()
+
+    def run_memestra(self, *options):
+        test_args = ['memestra', '--decorator', 'dec.deprecated',
+                     '--cache-dir', os.path.join(self.tmpdir, 'cache'),
+                     os.path.join(self.tmpdir, 'a.py')] + list(options)
+        with mock.patch.object(sys, 'argv', test_args):
+            from memestra.memestra import run
+            with StringIO() as out, StringIO() as err:
+                with contextlib.redirect_stdout(out), \
+                        contextlib.redirect_stderr(err):
+                    run()
+                return out.getvalue(), err.getvalue()
+
+    def test_stats(self):
+        out, err = self.run_memestra('--stats', '--stats-format', 'json')
+        self.assertIn('b.bar used at', out)
+        data = json.loads(err)
+        self.assertEqual(data['counters']['files scanned'], 1)
+        self.assertEqual(data['counters']['cache misses'], 1)
+        self.assertIn('def-use', data['timers'])
+        self.assertIn('deprecated users', data['timers'])
+        self.assertIn('total', data['timers'])
+
+        stats.clear()
+        out, err = self.run_memestra('--stats')
+        self.assertIn('b.bar used at', out)
+        self.assertIn('cache hits', err)
+        self.assertNotIn('cache misses', err)
@@ -0,0 +1,162 @@
+from unittest import TestCase, mock
+import os
+import shutil
+import sys
+import tempfile
+
+from memestra import utils
+
+TESTS_PATHS = [os.path.abspath(os.path.join(os.path.dirname(__file__), 'misc'))]
+
+class TestResolveModule(TestCase):
+
+    def setUp(self):
+        utils.resolution_cache.clear()
+
+    def test_memoized(self):
+        path = utils.resolve_module('some_module', TESTS_PATHS)
+        self.assertEqual(os.path.basename(path), 'some_module.py')
+        self.assertEqual(utils.resolution_cache.misses, 1)
+        self.assertEqual(utils.resolve_module('some_module', TESTS_PATHS),
+                         path)
+        self.assertEqual(utils.resolution_cache.hits, 1)
+
+    def test_memoized_not_found(self):
+        self.assertIsNone(utils.resolve_module('phantom_module', TESTS_PATHS))
+        self.assertIsNone(utils.resolve_module('phantom_module', TESTS_PATHS))
+        self.assertEqual(utils.resolution_cache.misses, 1)
+        self.assertEqual(utils.resolution_cache.hits, 1)
+
+    def test_search_paths(self):
+        tmpdir = tempfile.mkdtemp()
+        try:
+            open(os.path.join(tmpdir, 'tmp_module.py'), 'w').close()
+            self.assertIsNotNone(utils.resolve_module('tmp_module',
+                                                      [tmpdir]))
+            self.assertIsNone(utils.resolve_module('tmp_module'))
+            self.assertEqual(utils.resolution_cache.misses, 2)
+        finally:
+            shutil.rmtree(tmpdir)
+
+
+class TestExpandInputs(TestCase):
+
+    def test_expand(self):
+        tmpdir = tempfile.mkdtemp()
+        try:
+            for name in ('b.py', 'a.py', 'c.txt', os.path.join('d', 'e.py')):
+                path = os.path.join(tmpdir, name)
+                os.makedirs(os.path.dirname(path), exist_ok=True)
+                open(path, 'w').close()
+            a, b, e = (os.path.join(tmpdir, name)
+                       for name in ('a.py', 'b.py', os.path.join('d', 'e.py')))
+            self.assertEqual(utils.expand_inputs([tmpdir], {'.py'}),
+                             [a, b, e])
+            self.assertEqual(utils.expand_inputs([b, tmpdir], {'.py'}),
+                             [b, a, e])
+            self.assertEqual(
+                utils.expand_inputs([os.path.join(tmpdir, '*.py')], {'.py'}),
+                [a, b])
+            with self.assertRaises(ValueError):
+                utils.expand_inputs([os.path.join(tmpdir, 'f.py')], {'.py'})
+        finally:
+            shutil.rmtree(tmpdir)
+
+
+class TestModuleIndex(TestCase):
+
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.srcdir = os.path.join(self.tmpdir, 'src')
+        os.makedirs(self.srcdir)
+        open(os.path.join(self.srcdir, 'tmp_module.py'), 'w').close()
+        # pretend the sources are old enough to be indexed
+        os.utime(self.srcdir, (0, 0))
+        self.index_path = os.path.join(self.tmpdir, 'modules.json')
+
+    def tearDown(self):
+        utils.use_module_index(None)
+        utils.resolution_cache.clear()
+        shutil.rmtree(self.tmpdir)
+
+    def resolve(self, module_name):
+        # simulate a new process
+        utils.use_module_index(None)
+        utils.resolution_cache.clear()
+        index = utils.use_module_index(self.index_path)
+        path = utils.resolve_module(module_name, [self.srcdir])
+        index.save()
+        return index, path
+
+    def test_persistent(self):
+        index, path = self.resolve('tmp_module')
+        self.assertEqual(index.hits, 0)
+        self.assertTrue(os.path.isfile(self.index_path))
+        index, cached_path = self.resolve('tmp_module')
+        self.assertEqual(index.hits, 1)
+        self.assertEqual(index.misses, 0)
+        self.assertEqual(path, cached_path)
+
+    def test_not_found(self):
+        self.resolve('phantom_module')
+        index, path = self.resolve('phantom_module')
+        self.assertIsNone(path)
+        self.assertEqual(index.hits, 1)
+
+    def test_invalidation(self):
+        self.resolve('tmp_module')
+        os.remove(os.path.join(self.srcdir, 'tmp_module.py'))
+        index, path = self.resolve('tmp_module')
+        self.assertIsNone(path)
+        self.assertEqual(index.hits, 0)
+
+    def test_working_directory(self):
+        dirs = []
+        for name in ('A', 'B'):
+            path = os.path.join(self.tmpdir, name)
+            os.makedirs(path)
+            open(os.path.join(path, 'tmp_foo.py'), 'w').close()
+            os.utime(path, (0, 0))
+            dirs.append(path)
+
+        cwd = os.getcwd()
+        try:
+            with mock.patch.object(sys, 'path', [''] + sys.path):
+                for path in dirs:
+                    os.chdir(path)
+                    # simulate a new process
+                    utils.use_module_index(None)
+                    utils.resolution_cache.clear()
+                    index = utils.use_module_index(self.index_path)
+                    self.assertEqual(
+                        os.path.abspath(utils.resolve_module('tmp_foo')),
+                        os.path.join(path, 'tmp_foo.py'))
+                    index.save()
+        finally:
+            os.chdir(cwd)
+
+    def test_removed_index_dir(self):
+        index_dir = os.path.join(self.tmpdir, 'cache')
+        os.makedirs(index_dir)
+        utils.use_module_index(os.path.join(index_dir, 'modules.json'))
+        shutil.rmtree(index_dir)
+        self.assertIsNotNone(utils.resolve_module('json'))
+        with mock.patch.object(sys, 'path', sys.path + [self.srcdir]):
+            self.assertIsNotNone(utils.resolve_module('csv'))
+
+
+class TestIterModules(TestCase):
+
+    def test_package(self):
+        modules = list(utils.iter_modules(['json']))
+        self.assertEqual(modules[0], 'json')
+        self.assertIn('json.decoder', modules)
+
+    def test_environment(self):
+        modules = set(utils.iter_modules())
+        self.assertIn('memestra.caching', modules)
+        self.assertNotIn('memestra.__init__', modules)
+
+    def test_not_found(self):
+        with self.assertRaises(ValueError):
+            list(utils.iter_modules(['phantom_package']))